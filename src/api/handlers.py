@@ -7,28 +7,50 @@
 - /generation/start - запуск генерации данных
 - /generation/status - получение статуса генерации
 - /certificates/active - получение активных сертификатов
+- /certificates/active/download - скачивание CSV отчета
+- /certificates/active/stream - потоковая выгрузка CSV из БД
 - /client-certificates - получение связей клиент-сертификат
 
 """
 
+import base64
+import csv
+import io
+import json
+import multiprocessing
 import os
+import queue
 import sqlite3
-from concurrent.futures import ThreadPoolExecutor
-from contextlib import asynccontextmanager
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field, fields
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
-import pandas as pd
+import orjson
 import uvicorn
-from fastapi import BackgroundTasks, FastAPI, HTTPException, Query
-from fastapi.responses import FileResponse
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Query, Request
+from fastapi.responses import FileResponse, ORJSONResponse, Response, StreamingResponse
 
 from ..core import CertificateGenerator
-from ..database import StreamingCertificateDatabase
-from ..utils import MemoryMonitor, SystemOptimizer, logger
+from ..database import (
+    StreamingCertificateDatabase,
+    certificate_id_sql,
+    export_active_certificates_csv,
+    to_julian_day,
+)
+from ..database.database import _iter_active_rows
+from ..utils import (
+    ACTIVE_CERTIFICATES_HEADER,
+    MemoryMonitor,
+    SystemOptimizer,
+    logger,
+    ttl_cache,
+)
 from .models import (
-    ActiveCertificate,
     ActiveCertificatesResponse,
     ClientCertificateAssignment,
     ClientCertificateAssignmentsResponse,
@@ -36,18 +58,72 @@ from .models import (
     GenerationStatus,
 )
 
-# Глобальные переменные для отслеживания состояния
-generation_status = {
-    "is_running": False,
-    "progress": 0,
-    "total": 0,
-    "current_stage": "",
-    "start_time": None,
-    "error": None,
-}
 
-# Пул потоков для фоновых задач
-executor = ThreadPoolExecutor(max_workers=2)
+@dataclass
+class GenerationState:
+    """Состояние генерации, разделяемое между фоновой задачей и API"""
+
+    is_running: bool = False
+    progress: int = 0
+    total: int = 0
+    current_stage: str = ""
+    start_time: Optional[datetime] = None
+    error: Optional[str] = None
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False, compare=False
+    )
+
+    def update(self, **changes: Any) -> None:
+        """Атомарное обновление нескольких полей"""
+        with self._lock:
+            for name, value in changes.items():
+                setattr(self, name, value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Согласованная копия состояния для чтения"""
+        with self._lock:
+            return {f.name: getattr(self, f.name) for f in fields(self) if f.init}
+
+
+# Состояние генерации: пишет фоновая задача, читают обработчики
+generation_status = GenerationState()
+
+# Параметры генерации по умолчанию: значения полей модели без повторной
+# валидации на каждый запрос. Экземпляр только читается
+_DEFAULT_REQUEST = GenerationRequest.model_construct()
+
+# Отдельный процесс для записи CSV-отчета: не делит GIL с API.
+# spawn вместо fork, так как в процессе API уже работают потоки
+report_executor = ProcessPoolExecutor(
+    max_workers=1, mp_context=multiprocessing.get_context("spawn")
+)
+
+# PRAGMA для читающих соединений: WAL не блокирует запись генерации,
+# большой кэш и mmap переводят тяжелые выборки из fsync-bound в cache-bound
+READ_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -262144",  # 256MB кэш
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 4294967296",  # 4GB memory-mapped I/O
+    "PRAGMA query_only = ON",
+)
+
+# Строка UUID из BLOB-идентификатора сертификата в выборках
+CERTIFICATE_ID_SQL = certificate_id_sql("cc.certificate_id")
+
+# Размер чанка строк при потоковой выгрузке CSV
+STREAM_CHUNK_ROWS = 10000
+
+# Ключ keyset-пагинации: колонки составного индекса
+# idx_client_cert_expiry_composite и rowid, которым SQLite дополняет индекс
+CursorKey = Tuple[int, int, Union[bytes, str], str, int]
+
+# Пул читающих соединений: пары (идентификатор файла БД, соединение)
+RO_POOL_SIZE = 8
+_ro_pool: "queue.LifoQueue[Tuple[Tuple[int, int], sqlite3.Connection]]" = (
+    queue.LifoQueue(maxsize=RO_POOL_SIZE)
+)
 
 
 @asynccontextmanager
@@ -63,7 +139,8 @@ async def lifespan(app: FastAPI):
     yield
 
     logger.info("🛑 Остановка API управления сертификатами")
-    executor.shutdown(wait=True)
+    report_executor.shutdown(wait=True)
+    _close_read_connections()
 
 
 app = FastAPI(
@@ -71,32 +148,165 @@ app = FastAPI(
     description="Высокопроизводительная система для генерации и управления сертификатами клиентов",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 
+def _open_ro_conn(path: str) -> sqlite3.Connection:
+    """Открытие читающего соединения с оптимизированными PRAGMA"""
+    connection = sqlite3.connect(
+        f"file:{path}?mode=ro", uri=True, check_same_thread=False
+    )
+    for pragma in READ_PRAGMAS:
+        connection.execute(pragma)
+    return connection
+
+
+def _db_identity(path: str) -> Tuple[int, int]:
+    """Идентификатор файла БД: меняется, если файл удален и создан заново"""
+    stat = os.stat(path)
+    return stat.st_dev, stat.st_ino
+
+
+@contextmanager
+def _read_connection(path: str) -> Iterator[sqlite3.Connection]:
+    """
+    Читающее соединение из пула.
+
+    Соединения открываются по требованию и возвращаются в пул после запроса,
+    поэтому открытие файла и PRAGMA выполняются один раз на соединение.
+    Соединение к замененному файлу БД закрывается и открывается заново.
+    """
+    identity = _db_identity(path)
+    try:
+        pooled_identity, connection = _ro_pool.get_nowait()
+        if pooled_identity != identity:
+            connection.close()
+            connection = _open_ro_conn(path)
+    except queue.Empty:
+        connection = _open_ro_conn(path)
+
+    try:
+        yield connection
+    finally:
+        try:
+            _ro_pool.put_nowait((identity, connection))
+        except queue.Full:
+            connection.close()
+
+
+def _close_read_connections():
+    """Закрытие всех соединений пула"""
+    while True:
+        try:
+            _, connection = _ro_pool.get_nowait()
+        except queue.Empty:
+            return
+        connection.close()
+
+
+def _encode_cursor(key: CursorKey) -> str:
+    """Кодирование ключа последней строки страницы в курсор"""
+    client_id, expiry_julian, certificate_id, expiry_date, row_id = key
+    # BLOB-идентификатор передается hex-строкой с признаком типа
+    if isinstance(certificate_id, bytes):
+        encoded_id, is_blob = certificate_id.hex(), True
+    else:
+        encoded_id, is_blob = certificate_id, False
+    raw = json.dumps(
+        [
+            client_id,
+            expiry_julian,
+            encoded_id,
+            is_blob,
+            expiry_date,
+            row_id,
+        ],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> CursorKey:
+    """Декодирование курсора keyset-пагинации"""
+    try:
+        (
+            client_id,
+            expiry_julian,
+            certificate_id,
+            is_blob,
+            expiry_date,
+            row_id,
+        ) = json.loads(base64.urlsafe_b64decode(cursor))
+        if is_blob:
+            certificate_id = bytes.fromhex(certificate_id)
+        else:
+            certificate_id = str(certificate_id)
+        return (
+            int(client_id),
+            int(expiry_julian),
+            certificate_id,
+            str(expiry_date),
+            int(row_id),
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор пагинации")
+
+
+def _expiry_julian_sql(connection: sqlite3.Connection) -> str:
+    """
+    SQL-выражение юлианского дня истечения для client_certificates cc.
+
+    Читающие соединения открываются только на чтение и не мигрируют БД:
+    в базе, созданной до появления expiry_julian, день считается из
+    expiry_date на лету.
+    """
+    columns = {
+        row[1] for row in connection.execute("PRAGMA table_info(client_certificates)")
+    }
+    if "expiry_julian" in columns:
+        return "cc.expiry_julian"
+    return "CAST(julianday(cc.expiry_date) + 0.5 AS INTEGER)"
+
+
+def _stored_total(
+    connection: sqlite3.Connection, key: str, today_jd: int
+) -> Optional[int]:
+    """Итог из таблицы meta; None, если его нет или он посчитан на другую дату"""
+    try:
+        meta = dict(connection.execute("SELECT k, v FROM meta").fetchall())
+    except sqlite3.OperationalError:
+        # БД создана до появления таблицы meta
+        return None
+
+    if key == "total_active" and meta.get("active_as_of_jd") != today_jd:
+        return None
+    return meta.get(key)
+
+
+def _log_report_result(future: Future):
+    """Логирование ошибки фоновой записи отчета"""
+    error = future.exception()
+    if error is not None:
+        logger.error(f"Ошибка создания отчета: {error}")
+
+
 def update_progress(stage: str, current: int, total: int):
     """Обновление прогресса генерации"""
-    global generation_status
-    generation_status.update(
-        {"current_stage": stage, "progress": current, "total": total}
-    )
+    generation_status.update(current_stage=stage, progress=current, total=total)
 
 
 def run_generation_task(request: GenerationRequest):
     """Фоновая задача генерации данных"""
-    global generation_status
-
     try:
-        total_items = request.num_clients + request.num_certificates
+        total = request.num_clients + request.num_certificates
         generation_status.update(
-            {
-                "is_running": True,
-                "progress": 0,
-                "total": total_items,
-                "current_stage": "Инициализация",
-                "start_time": datetime.now(),
-                "error": None,
-            }
+            is_running=True,
+            progress=0,
+            total=total,
+            current_stage="Инициализация",
+            start_time=datetime.now(),
+            error=None,
         )
 
         logger.info(
@@ -104,12 +314,6 @@ def run_generation_task(request: GenerationRequest):
         )
 
         # 1. Инициализация генератора
-        total_value = generation_status.get("total", 0)
-        total = (
-            int(total_value)
-            if total_value is not None and isinstance(total_value, (int, str))
-            else 0
-        )
         update_progress("Инициализация генератора", 0, total)
         generator = CertificateGenerator(
             num_clients=request.num_clients,
@@ -127,7 +331,9 @@ def run_generation_task(request: GenerationRequest):
             num_certificates=request.num_certificates,
         )
         db.connect()
-        db.create_tables()
+        db.create_tables(with_indexes=False)
+        # Вся загрузка идет в одной транзакции: fsync на запуск, а не на батч
+        db.begin_bulk_load()
 
         # 3. Генерация клиентов
         update_progress("Генерация клиентов", 0, total)
@@ -158,59 +364,55 @@ def run_generation_task(request: GenerationRequest):
             f"Получен пул из {len(certificate_pool):,} сертификатов для назначений"
         )
 
-        assignment_batch_size = generator.batch_size
         total_assignments = 0
 
-        for start_id in range(1, request.num_clients + 1, assignment_batch_size):
-            end_id = min(start_id + assignment_batch_size, request.num_clients + 1)
-            client_ids = list(range(start_id, end_id))
-
-            assignments = generator.generate_assignments_batch(
-                client_ids, certificate_pool
-            )
-            db.insert_assignments_batch(assignments)
+        # Батчи строятся в потоках генератора, запись идет в этом потоке
+        for assignments in generator.generate_assignments_parallel(certificate_pool):
+            db.insert_assignments_direct(assignments)
             total_assignments += len(assignments)
 
         logger.info(f"Создано {total_assignments:,} назначений сертификатов")
 
         # 6. Финальная обработка
         update_progress("Финализация", total, total)
-        db.flush_all()
+        db.end_bulk_load()
+        db.create_indexes()
+        totals = db.store_totals()
+        total_active = totals["total_active"]
 
-        # 7. Генерация отчета по активным сертификатам
+        # 7. Отчет по активным сертификатам пишется в отдельном процессе со своим
+        # соединением, пока здесь выполняются optimize/VACUUM и закрытие БД
         update_progress("Создание отчета", total, total)
         output_dir = "output"
         Path(output_dir).mkdir(exist_ok=True)
 
         active_certs_file = f"{output_dir}/active_certificates.csv"
-        total_active = 0
-
-        with open(active_certs_file, "w", encoding="utf-8") as f:
-            f.write("client_id,certificate_id,expiry_date,days_until_expiry\n")
-
-            for chunk_df in db.get_active_certificates_streaming():
-                chunk_df.to_csv(f, header=False, index=False)
-                total_active += len(chunk_df)
+        report = report_executor.submit(
+            export_active_certificates_csv,
+            db.db_path,
+            active_certs_file,
+            totals["active_as_of_jd"],
+            compress=True,
+        )
+        report.add_done_callback(_log_report_result)
 
         db.close()
+        # Страницы прошлой генерации больше не будут запрошены
+        _active_certificates_page.cache_clear()
 
         logger.info(
             f"Генерация завершена успешно. Активных сертификатов: {total_active:,}"
         )
 
         generation_status.update(
-            {
-                "is_running": False,
-                "current_stage": f"Завершено. Активных сертификатов: {total_active:,}",
-                "progress": generation_status["total"],
-            }
+            is_running=False,
+            current_stage=f"Завершено. Активных сертификатов: {total_active:,}",
+            progress=total,
         )
 
     except Exception as e:
         logger.error(f"Ошибка генерации: {e}")
-        generation_status.update(
-            {"is_running": False, "error": str(e), "current_stage": "Ошибка"}
-        )
+        generation_status.update(is_running=False, error=str(e), current_stage="Ошибка")
 
 
 @app.post(
@@ -227,14 +429,12 @@ async def start_generation(
     Генерация выполняется в фоновом режиме. Используйте /generation/status для отслеживания прогресса.
     Если тело запроса не передано, используются значения по умолчанию.
     """
-    global generation_status
-
-    if generation_status["is_running"]:
+    if generation_status.is_running:
         raise HTTPException(status_code=409, detail="Генерация уже выполняется")
 
     # Если запрос не передан, используем значения по умолчанию
     if request is None:
-        request = GenerationRequest()
+        request = _DEFAULT_REQUEST
 
     # Проверяем системные ресурсы
     optimal_settings = SystemOptimizer.get_optimal_settings(
@@ -251,6 +451,7 @@ async def start_generation(
         "message": "Генерация запущена",
         "status": "started",
         "estimated_data_size_gb": f"{optimal_settings['estimated_data_size_gb']:.2f}",
+        "backend": optimal_settings["backend"],
     }
 
 
@@ -263,41 +464,180 @@ async def get_generation_status():
 
     Возвращает информацию о прогрессе, текущем этапе и возможных ошибках.
     """
-    global generation_status
+    status = generation_status.snapshot()
 
     # Расчет оставшегося времени
     estimated_time_remaining = None
-    if (
-        generation_status["is_running"]
-        and generation_status["start_time"]
-        and generation_status["progress"] > 0
-    ):
-        elapsed = (datetime.now() - generation_status["start_time"]).total_seconds()
-        progress_ratio = generation_status["progress"] / generation_status["total"]
+    if status["is_running"] and status["start_time"] and status["progress"] > 0:
+        elapsed = (datetime.now() - status["start_time"]).total_seconds()
+        progress_ratio = status["progress"] / status["total"]
 
         if progress_ratio > 0:
             total_estimated = elapsed / progress_ratio
             estimated_time_remaining = int(total_estimated - elapsed)
 
-    return GenerationStatus(
-        **generation_status, estimated_time_remaining=estimated_time_remaining
+    return GenerationStatus(**status, estimated_time_remaining=estimated_time_remaining)
+
+
+def _db_version(db_path: str) -> int:
+    """Версия данных БД: наибольшее время изменения файла БД и его WAL"""
+    version = os.stat(db_path).st_mtime_ns
+    try:
+        version = max(version, os.stat(f"{db_path}-wal").st_mtime_ns)
+    except FileNotFoundError:
+        pass
+    return version
+
+
+# Страниц в кэше /certificates/active: страница - до 10000 строк (сотни KB),
+# а страницы старых версий БД и дат не вытесняются ничем, кроме LRU
+ACTIVE_PAGE_CACHE_SIZE = 32
+
+
+@lru_cache(maxsize=ACTIVE_PAGE_CACHE_SIZE)
+def _active_certificates_page(
+    db_path: str,
+    page: int,
+    page_size: int,
+    client_id_filter: Optional[int],
+    seek: Optional[CursorKey],
+    today_jd: int,
+    db_version: int,
+) -> bytes:
+    """
+    Сериализованная страница активных сертификатов.
+
+    db_version и today_jd входят в ключ кэша: после новой генерации
+    или смены даты запрос выполняется заново.
+    """
+    with _read_connection(db_path) as connection:
+        expiry_julian = _expiry_julian_sql(connection)
+
+        # Основной запрос
+        where_clause = f"WHERE {expiry_julian} > ?"
+        params: List[Any] = [today_jd]
+
+        if client_id_filter:
+            where_clause += " AND cc.client_id = ?"
+            params.append(client_id_filter)
+
+        # Keyset-пагинация: продолжаем сразу после последней строки предыдущей
+        # страницы вместо пропуска OFFSET строк. Ключ - все колонки индекса
+        # и rowid: порядок целиком берется из индекса, без сортировки
+        seek_clause = ""
+        seek_params: List[Any] = []
+        offset = (page - 1) * page_size
+        if seek is not None:
+            seek_clause = (
+                f"AND (cc.client_id, {expiry_julian}, cc.certificate_id,"
+                " cc.expiry_date, cc.id) > (?, ?, ?, ?, ?)"
+            )
+            seek_params = list(seek)
+            offset = 0
+
+        # Все колонки есть в client_certificates: JOIN с clients/certificates
+        # не добавляет данных, а запрос покрывается индексом
+        # idx_client_cert_expiry_composite. Срок в днях - вычитание целых
+        # юлианских дней вместо двух вызовов julianday() на строку
+        query = f"""
+            SELECT
+                cc.id,
+                cc.client_id,
+                {CERTIFICATE_ID_SQL} as certificate_id,
+                cc.expiry_date,
+                {expiry_julian} - ? as days_until_expiry,
+                cc.certificate_id
+            FROM client_certificates cc
+            {where_clause}
+            {seek_clause}
+            ORDER BY
+                cc.client_id, {expiry_julian}, cc.certificate_id,
+                cc.expiry_date, cc.id
+            LIMIT ? OFFSET ?
+        """
+
+        # Итог без фильтра берется из meta для любой страницы; COUNT(*)
+        # выполняется только для первой
+        total_count = None
+        if seek is None and not client_id_filter:
+            total_count = _stored_total(connection, "total_active", today_jd)
+        if seek is None and page == 1 and total_count is None:
+            count_query = f"""
+                SELECT COUNT(*) as total
+                FROM client_certificates cc
+                {where_clause}
+            """
+
+            total_count = connection.execute(count_query, params).fetchone()[0]
+
+        # Страница за пределами данных: выборка по индексу не нужна
+        if total_count is not None and offset >= total_count:
+            rows = []
+        else:
+            # Запрашиваем на одну строку больше, чтобы определить has_next
+            final_params = [today_jd] + params + seek_params + [page_size + 1, offset]
+            rows = connection.execute(query, final_params).fetchall()
+
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+
+        # Строки - кортежи (id, client_id, certificate_id, expiry_date, days,
+        # certificate_id в формате хранения); days не бывает NULL: фильтр expiry_julian > ? отсекает пустые значения
+        # Данные из собственного SQL-запроса не валидируются повторно:
+        # ответ сериализуется orjson напрямую, минуя pydantic
+        certificates = [
+            {
+                "client_id": r[1],
+                "certificate_id": r[2],
+                "expiry_date": r[3],
+                "days_until_expiry": r[4],
+            }
+            for r in rows
+        ]
+
+        next_cursor = None
+        if has_next:
+            last = rows[-1]
+            next_cursor = _encode_cursor(
+                (last[1], last[4] + today_jd, last[5], last[3], last[0])
+            )
+
+    return orjson.dumps(
+        {
+            "certificates": certificates,
+            "total_count": total_count,
+            "page": page,
+            "page_size": page_size,
+            "has_next": has_next,
+            "next_cursor": next_cursor,
+        }
     )
 
 
+# Обработчики с блокирующим sqlite3 объявлены через обычный def: FastAPI
+# выполняет их в пуле потоков, и медленный запрос не останавливает event loop
 @app.get(
     "/certificates/active",
     response_model=ActiveCertificatesResponse,
     summary="Получение активных сертификатов",
 )
-async def get_active_certificates(
+def get_active_certificates(
+    request: Request,
     page: int = Query(1, ge=1, description="Номер страницы"),
     page_size: int = Query(100, ge=1, le=10000, description="Размер страницы"),
     client_id_filter: Optional[int] = Query(None, description="Фильтр по ID клиента"),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы (next_cursor из ответа)"
+    ),
 ):
     """
     Получение списка клиентов с активными сертификатами.
 
     Возвращает постраничный список активных сертификатов с возможностью фильтрации.
+    Для глубокого пролистывания используйте next_cursor вместо номера страницы:
+    keyset-пагинация выполняется за O(page_size) независимо от глубины.
+    Общее количество считается только для первой страницы.
+    Ответы кэшируются до изменения БД; поддерживается If-None-Match.
     """
     db_path = "data/certificates.db"
 
@@ -307,92 +647,80 @@ async def get_active_certificates(
             detail="База данных не найдена. Сначала запустите генерацию данных.",
         )
 
-    try:
-        connection = sqlite3.connect(db_path)
-        connection.row_factory = sqlite3.Row
+    seek = _decode_cursor(cursor) if cursor else None
 
-        current_date = datetime.now().date()
-        offset = (page - 1) * page_size
+    try:
+        today_jd = to_julian_day(datetime.now().date())
+        db_version = _db_version(db_path)
 
-        # Основной запрос
-        where_clause = "WHERE cc.expiry_date > ?"
-        params = [str(current_date)]
+        # Содержимое страницы зависит только от версии БД и текущей даты
+        etag = f'"{db_version}-{today_jd}-{page}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
 
-        if client_id_filter:
-            where_clause += " AND c.client_id = ?"
-            params.append(str(client_id_filter))
+        content = _active_certificates_page(
+            db_path, page, page_size, client_id_filter, seek, today_jd, db_version
+        )
+        return Response(
+            content=content, media_type="application/json", headers={"ETag": etag}
+        )
 
-        query = f"""
-            SELECT
-                c.client_id,
-                cert.certificate_id,
-                cc.expiry_date,
-                ROUND((julianday(cc.expiry_date) - julianday(date('now'))), 0) as days_until_expiry
-            FROM clients c
-            JOIN client_certificates cc ON c.client_id = cc.client_id
-            JOIN certificates cert ON cc.certificate_id = cert.certificate_id
-            {where_clause}
-            ORDER BY c.client_id, cc.expiry_date
-            LIMIT ? OFFSET ?
-        """
+    except Exception as e:
+        logger.error(f"Ошибка получения активных сертификатов: {e}")
+        raise HTTPException(
+            status_code=500, detail=f"Ошибка получения данных: {str(e)}"
+        )
 
-        # Параметры: WHERE clause параметры + LIMIT + OFFSET
-        final_params = params + [page_size, offset]
 
-        df = pd.read_sql_query(query, connection, params=final_params)
+def _where_sql(conditions: List[str]) -> str:
+    """Предложение WHERE из условий через AND; пустое, если условий нет"""
+    return "WHERE " + " AND ".join(conditions) if conditions else ""
 
-        # Подсчет общего количества
-        count_query = f"""
-            SELECT COUNT(*) as total
-            FROM clients c
-            JOIN client_certificates cc ON c.client_id = cc.client_id
-            JOIN certificates cert ON cc.certificate_id = cert.certificate_id
-            {where_clause}
-        """
 
-        count_params = params  # Используем те же параметры что и в основном запросе
+def _assignment_filters(
+    expiry_julian: str,
+    client_id_filter: Optional[int],
+    active_only: bool,
+    today_jd: int,
+) -> Tuple[List[str], List[Any]]:
+    """Условия и параметры фильтров /client-certificates"""
+    conditions = []
+    params: List[Any] = []
 
-        total_count = pd.read_sql_query(
-            count_query, connection, params=count_params
-        ).iloc[0]["total"]
+    # Фильтр по клиенту
+    if client_id_filter:
+        conditions.append("cc.client_id = ?")
+        params.append(client_id_filter)
 
-        connection.close()
+    # Фильтр только активные
+    if active_only:
+        conditions.append(f"{expiry_julian} > ?")
+        params.append(today_jd)
 
-        # Преобразование в модели Pydantic
-        certificates = []
-        for _, row in df.iterrows():
-            # Безопасное преобразование days_until_expiry
-            days_until_expiry = 0
-            if (
-                pd.notna(row["days_until_expiry"])
-                and row["days_until_expiry"] is not None
-            ):
-                days_until_expiry = int(row["days_until_expiry"])
-
-            certificates.append(
-                ActiveCertificate(
-                    client_id=int(row["client_id"]),
-                    certificate_id=str(row["certificate_id"]),
-                    expiry_date=str(row["expiry_date"]),
-                    days_until_expiry=days_until_expiry,
-                )
-            )
+    return conditions, params
 
-        has_next = (page * page_size) < total_count
 
-        return ActiveCertificatesResponse(
-            certificates=certificates,
-            total_count=total_count,
-            page=page,
-            page_size=page_size,
-            has_next=has_next,
-        )
+def _assignment_seek(expiry_julian: str, seek: CursorKey) -> Tuple[str, List[Any]]:
+    """
+    Условие keyset-пагинации /client-certificates и его параметры.
 
-    except Exception as e:
-        logger.error(f"Ошибка получения активных сертификатов: {e}")
-        raise HTTPException(
-            status_code=500, detail=f"Ошибка получения данных: {str(e)}"
-        )
+    Порядок - (client_id, expiry_julian DESC, certificate_id, expiry_date, id):
+    строки после ключа - следующие клиенты, более ранний срок того же клиента
+    или тот же срок с большим остатком ключа.
+    """
+    condition = (
+        f"cc.client_id >= ? AND (cc.client_id > ? OR {expiry_julian} < ?"
+        f" OR ({expiry_julian} = ? AND"
+        " (cc.certificate_id, cc.expiry_date, cc.id) > (?, ?, ?)))"
+    )
+    client_id, last_expiry_julian, *tail = seek
+    return condition, [
+        client_id,
+        client_id,
+        last_expiry_julian,
+        last_expiry_julian,
+        *tail,
+    ]
 
 
 @app.get(
@@ -400,7 +728,7 @@ async def get_active_certificates(
     response_model=ClientCertificateAssignmentsResponse,
     summary="Получение связей клиент-сертификат",
 )
-async def get_client_certificate_assignments(
+def get_client_certificate_assignments(
     skip: int = Query(0, ge=0, description="Количество записей для пропуска (offset)"),
     limit: int = Query(
         100, ge=1, le=10000, description="Максимальное количество записей"
@@ -409,11 +737,15 @@ async def get_client_certificate_assignments(
     active_only: bool = Query(
         False, description="Показать только активные сертификаты"
     ),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы (next_cursor из ответа)"
+    ),
 ):
     """
     Получение связей между клиентами и сертификатами с пагинацией.
 
     Возвращает список всех назначений сертификатов с информацией о статусе и времени до истечения.
+    При передаче cursor параметр skip игнорируется, а общее количество не считается.
     """
     db_path = "data/certificates.db"
 
@@ -423,101 +755,108 @@ async def get_client_certificate_assignments(
             detail="База данных не найдена. Сначала запустите генерацию данных.",
         )
 
-    try:
-        connection = sqlite3.connect(db_path)
-        connection.row_factory = sqlite3.Row
-
-        current_date = datetime.now().date()
-
-        # Базовый запрос
-        where_conditions = []
-        params = []
-
-        # Фильтр по клиенту
-        if client_id_filter:
-            where_conditions.append("cc.client_id = ?")
-            params.append(str(client_id_filter))
-
-        # Фильтр только активные
-        if active_only:
-            where_conditions.append("cc.expiry_date > ?")
-            params.append(str(current_date))
-
-        where_clause = ""
-        if where_conditions:
-            where_clause = "WHERE " + " AND ".join(where_conditions)
-
-        # Основной запрос с пагинацией
-        query = f"""
-            SELECT
-                cc.id,
-                cc.client_id,
-                cc.certificate_id,
-                cc.expiry_date,
-                CASE WHEN cc.expiry_date > ? THEN 1 ELSE 0 END as is_active,
-                CASE WHEN cc.expiry_date > ?
-                     THEN ROUND((julianday(cc.expiry_date) - julianday(?)), 0)
-                     ELSE NULL
-                END as days_until_expiry
-            FROM client_certificates cc
-            {where_clause}
-            ORDER BY cc.client_id, cc.expiry_date DESC
-            LIMIT ? OFFSET ?
-        """
+    seek = _decode_cursor(cursor) if cursor else None
 
-        # Параметры для основного запроса
-        query_params = (
-            [str(current_date), str(current_date), str(current_date)]
-            + params
-            + [limit, skip]
-        )
-
-        df = pd.read_sql_query(query, connection, params=query_params)
-
-        # Подсчет общего количества
-        count_query = f"""
-            SELECT COUNT(*) as total
-            FROM client_certificates cc
-            {where_clause}
-        """
-
-        count_params = params
-        total_count = pd.read_sql_query(
-            count_query, connection, params=count_params
-        ).iloc[0]["total"]
+    try:
+        # Текущий юлианский день считается один раз и передается константой
+        today_jd = to_julian_day(datetime.now().date())
 
-        connection.close()
+        with _read_connection(db_path) as connection:
+            expiry_julian = _expiry_julian_sql(connection)
 
-        # Преобразование в модели Pydantic
-        assignments = []
-        for _, row in df.iterrows():
-            # Безопасное преобразование days_until_expiry
-            days_until_expiry = None
-            if (
-                pd.notna(row["days_until_expiry"])
-                and row["days_until_expiry"] is not None
-            ):
-                days_until_expiry = int(row["days_until_expiry"])
-
-            assignments.append(
-                ClientCertificateAssignment(
-                    id=int(row["id"]),
-                    client_id=int(row["client_id"]),
-                    certificate_id=str(row["certificate_id"]),
-                    expiry_date=str(row["expiry_date"]),
-                    is_active=bool(row["is_active"]),
-                    days_until_expiry=days_until_expiry,
+            where_conditions, params = _assignment_filters(
+                expiry_julian, client_id_filter, active_only, today_jd
+            )
+            where_clause = _where_sql(where_conditions)
+
+            seek_conditions = list(where_conditions)
+            seek_params = list(params)
+            offset = skip
+            if seek is not None:
+                seek_condition, last_key_params = _assignment_seek(expiry_julian, seek)
+                seek_conditions.append(seek_condition)
+                seek_params += last_key_params
+                offset = 0
+            seek_clause = _where_sql(seek_conditions)
+
+            # Основной запрос с пагинацией
+            query = f"""
+                SELECT
+                    cc.id,
+                    cc.client_id,
+                    {CERTIFICATE_ID_SQL} as certificate_id,
+                    cc.expiry_date,
+                    {expiry_julian} > ? as is_active,
+                    CASE WHEN {expiry_julian} > ?
+                         THEN {expiry_julian} - ?
+                         ELSE NULL
+                    END as days_until_expiry,
+                    {expiry_julian},
+                    cc.certificate_id
+                FROM client_certificates cc
+                {seek_clause}
+                ORDER BY
+                    cc.client_id, {expiry_julian} DESC, cc.certificate_id,
+                    cc.expiry_date, cc.id
+                LIMIT ? OFFSET ?
+            """
+
+            # Итог без фильтра берется из meta при любом skip; COUNT(*)
+            # выполняется только для первой страницы
+            total_count = None
+            if seek is None and not client_id_filter:
+                total_count = _stored_total(
+                    connection,
+                    "total_active" if active_only else "total_assignments",
+                    today_jd,
                 )
+            if seek is None and skip == 0 and total_count is None:
+                count_query = f"""
+                    SELECT COUNT(*) as total
+                    FROM client_certificates cc
+                    {where_clause}
+                """
+
+                total_count = connection.execute(count_query, params).fetchone()[0]
+
+            # Смещение за пределами данных: выборка по индексу не нужна
+            if total_count is not None and offset >= total_count:
+                rows = []
+            else:
+                # Параметры для основного запроса; лишняя строка определяет has_next
+                query_params = [today_jd] * 3 + seek_params + [limit + 1, offset]
+                rows = connection.execute(query, query_params).fetchall()
+
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+
+        # Строки - кортежи (id, client_id, certificate_id, expiry_date,
+        # is_active, days_until_expiry, expiry_julian, certificate_id в формате
+        # хранения)
+        assignments = [
+            ClientCertificateAssignment.model_construct(
+                id=r[0],
+                client_id=r[1],
+                certificate_id=r[2],
+                expiry_date=r[3],
+                is_active=bool(r[4]),
+                days_until_expiry=r[5],
             )
+            for r in rows
+        ]
 
-        has_next = (skip + limit) < total_count
+        next_cursor = None
+        if has_next:
+            last = rows[-1]
+            next_cursor = _encode_cursor((last[1], last[6], last[7], last[3], last[0]))
 
-        return ClientCertificateAssignmentsResponse(
+        return ClientCertificateAssignmentsResponse.model_construct(
             assignments=assignments,
             total_count=total_count,
             skip=skip,
             limit=limit,
             has_next=has_next,
+            next_cursor=next_cursor,
         )
 
     except Exception as e:
@@ -527,14 +866,31 @@ async def get_client_certificate_assignments(
         )
 
 
+def _fresh_gzip_copy(csv_file: str) -> Optional[str]:
+    """
+    Путь к сжатой копии отчета, если она не старше самого отчета.
+
+    Пока gzip_copy сжимает новый отчет, рядом может лежать копия
+    предыдущей генерации: ее отдавать нельзя.
+    """
+    gz_file = f"{csv_file}.gz"
+    try:
+        if os.stat(gz_file).st_mtime_ns >= os.stat(csv_file).st_mtime_ns:
+            return gz_file
+    except FileNotFoundError:
+        pass
+    return None
+
+
 @app.get(
     "/certificates/active/download", summary="Скачать отчет по активным сертификатам"
 )
-async def download_active_certificates():
+async def download_active_certificates(request: Request):
     """
     Скачивание полного отчета по активным сертификатам в формате CSV.
 
     Возвращает файл со всеми активными сертификатами.
+    Клиентам с Accept-Encoding: gzip отдается заранее сжатая копия.
     """
     csv_file = "output/active_certificates.csv"
 
@@ -544,21 +900,105 @@ async def download_active_certificates():
             detail="Файл отчета не найден. Сначала запустите генерацию данных.",
         )
 
+    gz_file = _fresh_gzip_copy(csv_file)
+    if gz_file and "gzip" in request.headers.get("accept-encoding", ""):
+        return FileResponse(
+            path=gz_file,
+            filename="active_certificates.csv",
+            media_type="text/csv",
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+        )
+
     return FileResponse(
-        path=csv_file, filename="active_certificates.csv", media_type="text/csv"
+        path=csv_file,
+        filename="active_certificates.csv",
+        media_type="text/csv",
+        headers={"Vary": "Accept-Encoding"},
+    )
+
+
+def _stream_active_certificates_csv(db_path: str) -> Iterator[str]:
+    """Генератор CSV активных сертификатов чанками по STREAM_CHUNK_ROWS строк"""
+    today_jd = to_julian_day(datetime.now().date())
+    # Отдельное соединение: поток может длиться долго и не должен занимать пул
+    connection = _open_ro_conn(db_path)
+    try:
+        row_chunks = _iter_active_rows(
+            connection, today_jd, STREAM_CHUNK_ROWS, _expiry_julian_sql(connection)
+        )
+
+        # Один буфер на весь поток: очищается после каждого чанка
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(ACTIVE_CERTIFICATES_HEADER)
+
+        for rows in row_chunks:
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        connection.close()
+
+
+@app.get(
+    "/certificates/active/stream",
+    summary="Потоковая выгрузка активных сертификатов",
+)
+def stream_active_certificates():
+    """
+    Выгрузка активных сертификатов в CSV напрямую из БД.
+
+    В отличие от /certificates/active/download отражает текущее состояние БД
+    и не требует сохраненного файла отчета.
+    """
+    db_path = "data/certificates.db"
+
+    if not os.path.exists(db_path):
+        raise HTTPException(
+            status_code=404,
+            detail="База данных не найдена. Сначала запустите генерацию данных.",
+        )
+
+    return StreamingResponse(
+        _stream_active_certificates_csv(db_path),
+        media_type="text/csv",
+        headers={
+            "Content-Disposition": 'attachment; filename="active_certificates.csv"'
+        },
     )
 
 
+# Балансировщики опрашивают /health часто: память и наличие БД
+# перечитываются не чаще раза в HEALTH_CACHE_TTL секунд
+HEALTH_CACHE_TTL = 0.5
+
+
+@ttl_cache(HEALTH_CACHE_TTL)
+def _cached_memory_usage() -> float:
+    """Использование памяти процессом в MB"""
+    return MemoryMonitor.get_memory_usage()
+
+
+@ttl_cache(HEALTH_CACHE_TTL)
+def _cached_database_exists() -> bool:
+    """Наличие файла БД"""
+    return os.path.exists("data/certificates.db")
+
+
 @app.get("/health", summary="Проверка состояния системы")
 async def health_check():
     """Проверка состояния системы и ресурсов"""
-    memory_usage = MemoryMonitor.get_memory_usage()
+    memory_usage = _cached_memory_usage()
 
     return {
         "status": "healthy",
         "memory_usage_mb": round(memory_usage, 2),
-        "generation_running": generation_status["is_running"],
-        "database_exists": os.path.exists("data/certificates.db"),
+        "generation_running": generation_status.is_running,
+        "database_exists": _cached_database_exists(),
     }
 
 
@@ -53,10 +53,11 @@ class ActiveCertificatesResponse(BaseModel):
     """Модель ответа с активными сертификатами"""
 
     certificates: List[ActiveCertificate]
-    total_count: int
+    total_count: Optional[int] = None
     page: int
     page_size: int
     has_next: bool
+    next_cursor: Optional[str] = None
 
 
 class ClientCertificateAssignment(BaseModel):
@@ -74,7 +75,8 @@ class ClientCertificateAssignmentsResponse(BaseModel):
     """Модель ответа со связями клиент-сертификат"""
 
     assignments: List[ClientCertificateAssignment]
-    total_count: int
+    total_count: Optional[int] = None
     skip: int
     limit: int
     has_next: bool
+    next_cursor: Optional[str] = None
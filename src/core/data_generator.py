@@ -4,23 +4,63 @@
 
 """
 
-import gc
 import os
-import random
+import queue
 import threading
 import time
-import uuid
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime, timedelta
+from datetime import date
 from pathlib import Path
-from typing import Dict, Generator, List
+from typing import Generator, Iterable, List, Optional, Sequence, Tuple, Union
 
-from faker import Faker
+import numpy as np
 from tqdm import tqdm
 
-from ..database import StreamingCertificateDatabase
+from ..database import StreamingCertificateDatabase, export_active_certificates_csv
 from ..utils import MemoryMonitor, SystemOptimizer, logger
 
+# Seed для воспроизводимых ID сертификатов
+CERTIFICATE_ID_SEED = 42
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    """Хэш splitmix64 для массива uint64 (переполнение по модулю 2**64)"""
+    z = x + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def certificate_id_bytes(start_index: int, count: int) -> np.ndarray:
+    """
+    16 байт UUID4 для сертификатов с индексами start_index..start_index+count-1.
+
+    Байты зависят только от индекса и CERTIFICATE_ID_SEED, поэтому ID
+    воспроизводимы при любом разбиении на батчи и не трогают глобальный random.
+    """
+    keys = np.arange(start_index, start_index + count, dtype=np.uint64)
+    keys = keys * np.uint64(2) + np.uint64(CERTIFICATE_ID_SEED)
+
+    # Версия 4 и вариант RFC 4122, как у uuid.uuid4()
+    hi = (_splitmix64(keys) & np.uint64(0xFFFFFFFFFFFF0FFF)) | np.uint64(0x4000)
+    lo = _splitmix64(keys + np.uint64(1)) & np.uint64(0x3FFFFFFFFFFFFFFF)
+    lo |= np.uint64(0x8000000000000000)
+
+    halves = np.empty((count, 2), dtype=">u8")
+    halves[:, 0] = hi
+    halves[:, 1] = lo
+    return halves.view(np.uint8)
+
+
+def split_certificate_ids(raw: np.ndarray) -> List[bytes]:
+    """Список 16-байтных ID из массива shape (n, 16) для вставки в BLOB"""
+    data = raw.tobytes()
+    return [data[i : i + 16] for i in range(0, len(data), 16)]
+
+
+# Элемент очереди назначений: батч, ошибка производителя или None - поток
+# завершил работу
+_AssignmentItem = Optional[Union[List[Tuple[int, bytes, str]], Exception]]
+
 
 class CertificateGenerator:
     """генератор данных с автоматической оптимизацией"""
@@ -48,6 +88,9 @@ class CertificateGenerator:
             self.batch_size = batch_size
             self.num_workers = num_workers
 
+        # Генератор случайных чисел для назначений (PCG64)
+        self._rng = np.random.default_rng()
+
         logger.info(
             f"Инициализация генератора: {num_clients:,} клиентов, "
             f"{num_certificates:,} сертификатов"
@@ -56,136 +99,190 @@ class CertificateGenerator:
             f"Размер батча: {self.batch_size:,}, Рабочих потоков: {self.num_workers}"
         )
 
-        # Thread-safe генераторы Faker для каждого потока
-        self._faker_instances: Dict[int, Faker] = {}
-        self._lock = threading.Lock()
-
-    def _get_faker(self) -> Faker:
-        """Получение thread-safe экземпляра Faker"""
-        thread_id = threading.get_ident()
-        if thread_id not in self._faker_instances:
-            with self._lock:
-                if thread_id not in self._faker_instances:
-                    self._faker_instances[thread_id] = Faker("ru_RU")
-        return self._faker_instances[thread_id]
-
-    def generate_clients_batch(self, start_id: int, count: int) -> List[Dict]:
-        """Генерация батча клиентов в одном потоке"""
-        clients = []
-        for i in range(start_id, start_id + count):
-            client = {"client_id": i}
-            clients.append(client)
-        return clients
-
-    def generate_certificates_batch(self, start_id: int, count: int) -> List[Dict]:
-        """Генерация батча сертификатов в одном потоке"""
-        certificates = []
-
-        # Используем индекс для генерации консистентных ID
-        for i in range(count):
-            certificate_index = start_id - 1 + i  # start_id начинается с 1
-            cert_id = self.generate_consistent_certificate_id(certificate_index)
-            certificate = {"certificate_id": cert_id}
-            certificates.append(certificate)
-        return certificates
+    def generate_clients_batch(self, start_id: int, count: int) -> List[Tuple[int]]:
+        """Генерация батча клиентов: кортежи (client_id,)"""
+        # zip по одной последовательности собирает кортежи на C, без цикла Python
+        return list(zip(range(start_id, start_id + count)))
+
+    def generate_certificates_batch(
+        self, start_id: int, count: int
+    ) -> List[Tuple[bytes]]:
+        """Генерация батча сертификатов: кортежи (certificate_id,)"""
+        # ID всего батча считаются одной векторной операцией; start_id с 1
+        cert_ids = split_certificate_ids(certificate_id_bytes(start_id - 1, count))
+        return list(zip(cert_ids))
 
     def generate_assignments_batch(
-        self, client_ids: List[int], certificate_pool: List[str]
-    ) -> List[Dict]:
-        """Генерация назначений для батча клиентов"""
-        assignments = []
-
-        for client_id in client_ids:
-            # Каждый клиент может иметь от 0 до 20 сертификатов
-            num_certs = random.randint(0, 20)
-
-            # Каждый клиент может получить любые сертификаты из пула (один сертификат может быть у нескольких клиентов)
-            client_certificates = random.sample(
-                certificate_pool, min(num_certs, len(certificate_pool))
+        self,
+        client_ids: List[int],
+        certificate_pool: Union[np.ndarray, Sequence],
+        rng: np.random.Generator = None,
+    ) -> List[Tuple[int, bytes, str]]:
+        """
+        Назначения для батча клиентов: (client_id, certificate_id, expiry_date),
+        дата - строка ISO (YYYY-MM-DD).
+
+        Случайные числа всего батча генерируются векторно одним вызовом
+        на каждую величину вместо вызовов random на каждую строку.
+        Пул из get_certificate_pool - массив (n, 16), ID выбираются одной
+        векторной выборкой; обычная последовательность ID тоже принимается.
+        Потоки передают свой rng: Generator NumPy не потокобезопасен.
+        """
+        pool_size = len(certificate_pool)
+        if not client_ids or not pool_size:
+            return []
+
+        if rng is None:
+            rng = self._rng
+
+        # Каждый клиент может иметь от 0 до 20 сертификатов
+        num_certs = rng.integers(0, 21, size=len(client_ids))
+
+        # Выборка с возвращением; повторы у одного клиента убираются через
+        # unique по ключу (клиент, сертификат), он же сортирует по client_id
+        client_idx = np.repeat(np.arange(len(client_ids), dtype=np.int64), num_certs)
+        cert_idx = rng.integers(0, pool_size, size=client_idx.size, dtype=np.int64)
+        keys = np.unique(client_idx * pool_size + cert_idx)
+        client_idx, cert_idx = np.divmod(keys, pool_size)
+
+        # Период действия от 3 месяцев до 20 лет (в днях); дата истечения
+        # от 365 дней в прошлом и до конца периода, перевес в валидные
+        validity_days = rng.integers(90, 7301, size=keys.size)
+        offsets = rng.integers(-365, validity_days + 1)
+        # Сразу строки ISO: БД пишет дату текстом, адаптер date не нужен
+        expiry_dates = np.datetime_as_string(
+            np.datetime64(date.today(), "D") + offsets, unit="D"
+        )
+
+        certificate_ids: Iterable[bytes]
+        if isinstance(certificate_pool, np.ndarray):
+            certificate_ids = split_certificate_ids(certificate_pool[cert_idx])
+        else:
+            certificate_ids = map(certificate_pool.__getitem__, cert_idx.tolist())
+
+        return list(
+            zip(
+                np.asarray(client_ids)[client_idx].tolist(),
+                certificate_ids,
+                expiry_dates.tolist(),
             )
+        )
 
-            for certificate_id in client_certificates:
-                # Период действия от 3 месяцев до 20 лет (в днях)
-                validity_days = random.randint(90, 7300)
+    def generate_clients_parallel(self) -> Generator[List[Tuple], None, None]:
+        """
+        Генерация клиентов батчами.
 
-                # Генерируем дату истечения
-                # от 365 дней в прошлом и до 7300 дней вперед, перевес в валидные сертификаты
-                expiry_date = datetime.now().date() + timedelta(
-                    days=random.randint(-365, validity_days)
-                )
+        Батч считается быстрее, чем его отправка в пул потоков, поэтому
+        генерация последовательная: батчи идут строго по порядку client_id.
+        """
+        logger.info(f"Генерация {self.num_clients:,} клиентов...")
 
-                assignment = {
-                    "client_id": client_id,
-                    "certificate_id": certificate_id,
-                    "expiry_date": expiry_date,
-                }
-
-                assignments.append(assignment)
-
-        return assignments
-
-    def generate_clients_parallel(self) -> Generator[List[Dict], None, None]:
-        """Параллельная генерация клиентов батчами"""
-        logger.info(f"Генерация {self.num_clients:,} клиентов параллельно...")
-
-        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
-            # Создаем задачи для батчей
-            futures = []
-            for start_id in range(1, self.num_clients + 1, self.batch_size):
-                count = min(self.batch_size, self.num_clients - start_id + 1)
-                future = executor.submit(self.generate_clients_batch, start_id, count)
-                futures.append(future)
-
-            # Получаем результаты по мере готовности
-            with tqdm(total=len(futures), desc="Генерация клиентов") as pbar:
-                for future in as_completed(futures):
-                    batch = future.result()
-                    yield batch
-                    pbar.update(1)
-
-                    # Принудительная очистка памяти
-                    if pbar.n % 10 == 0:
-                        gc.collect()
-
-    def generate_certificates_parallel(self) -> Generator[List[Dict], None, None]:
-        """Параллельная генерация сертификатов батчами"""
-        logger.info(f"Генерация {self.num_certificates:,} сертификатов параллельно...")
-
-        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
-            # Создаем задачи для батчей
-            futures = []
-            remaining = self.num_certificates
-            start_id = 1
-
-            while remaining > 0:
-                count = min(self.batch_size, remaining)
-                future = executor.submit(
-                    self.generate_certificates_batch, start_id, count
+        for start_id in tqdm(
+            range(1, self.num_clients + 1, self.batch_size),
+            desc="Генерация клиентов",
+        ):
+            count = min(self.batch_size, self.num_clients - start_id + 1)
+            yield self.generate_clients_batch(start_id, count)
+
+    def generate_certificates_parallel(self) -> Generator[List[Tuple], None, None]:
+        """Генерация сертификатов батчами по порядку индексов"""
+        logger.info(f"Генерация {self.num_certificates:,} сертификатов...")
+
+        for start_id in tqdm(
+            range(1, self.num_certificates + 1, self.batch_size),
+            desc="Генерация сертификатов",
+        ):
+            count = min(self.batch_size, self.num_certificates - start_id + 1)
+            yield self.generate_certificates_batch(start_id, count)
+
+    def generate_assignments_parallel(
+        self, certificate_pool: Union[np.ndarray, Sequence]
+    ) -> Generator[List[Tuple[int, bytes, str]], None, None]:
+        """
+        Генерация назначений для всех клиентов в num_workers потоках.
+
+        Каждый поток-производитель берет свою часть батчей client_id и свой
+        дочерний RNG. Готовые батчи идут через ограниченную очередь в
+        вызывающий поток, который пишет их в БД: генерация перекрывается с
+        записью, а производители ждут, если запись отстает.
+        """
+        starts = range(1, self.num_clients + 1, self.batch_size)
+        num_workers = max(1, min(self.num_workers, len(starts)))
+        batches: "queue.Queue[_AssignmentItem]" = queue.Queue(maxsize=num_workers * 2)
+        stop = threading.Event()
+
+        workers = [
+            threading.Thread(
+                target=self._produce_assignments,
+                args=(starts[i::num_workers], rng, certificate_pool, batches, stop),
+                daemon=True,
+            )
+            for i, rng in enumerate(self._rng.spawn(num_workers))
+        ]
+        for worker in workers:
+            worker.start()
+
+        try:
+            yield from self._drain_assignments(batches, num_workers)
+        finally:
+            # Освобождаем производителей, ждущих места в очереди
+            stop.set()
+            while any(worker.is_alive() for worker in workers):
+                try:
+                    batches.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+    def _produce_assignments(
+        self,
+        worker_starts: range,
+        rng: np.random.Generator,
+        certificate_pool: Union[np.ndarray, Sequence],
+        batches: "queue.Queue[_AssignmentItem]",
+        stop: threading.Event,
+    ):
+        """Тело потока-производителя: батчи своей части client_id в очередь"""
+        try:
+            for start_id in worker_starts:
+                if stop.is_set():
+                    return
+                end_id = min(start_id + self.batch_size, self.num_clients + 1)
+                batches.put(
+                    self.generate_assignments_batch(
+                        list(range(start_id, end_id)), certificate_pool, rng
+                    )
                 )
-                futures.append(future)
-                start_id += count
-                remaining -= count
-
-            # Получаем результаты по мере готовности
-            with tqdm(total=len(futures), desc="Генерация сертификатов") as pbar:
-                for future in as_completed(futures):
-                    batch = future.result()
-                    yield batch
-                    pbar.update(1)
-
-                    # Принудительная очистка памяти
-                    if pbar.n % 10 == 0:
-                        gc.collect()
-
-    def generate_consistent_certificate_id(self, index: int) -> str:
-        """Генерация консистентного ID сертификата по индексу"""
-        # Используем индекс для создания уникального, но воспроизводимого ID
-        random.seed(42 + index)  # Seed на основе индекса
-        cert_id = str(uuid.uuid4())
-        return cert_id
-
-    def get_certificate_pool(self, connection=None) -> List[str]:
-        """Получение пула ID сертификатов из базы данных для назначений"""
+        except Exception as e:
+            batches.put(e)
+        finally:
+            batches.put(None)
+
+    @staticmethod
+    def _drain_assignments(
+        batches: "queue.Queue[_AssignmentItem]", num_workers: int
+    ) -> Generator[List[Tuple[int, bytes, str]], None, None]:
+        """Батчи из очереди, пока не завершатся все производители"""
+        finished = 0
+        while finished < num_workers:
+            batch = batches.get()
+            if batch is None:
+                finished += 1
+            elif isinstance(batch, Exception):
+                raise batch
+            else:
+                yield batch
+
+    def generate_consistent_certificate_id(self, index: int) -> bytes:
+        """Генерация консистентного ID сертификата по индексу (16 байт UUID)"""
+        return certificate_id_bytes(index, 1).tobytes()
+
+    def get_certificate_pool(self, connection=None) -> np.ndarray:
+        """
+        Получение пула ID сертификатов из базы данных для назначений.
+
+        Пул - непрерывный массив uint8 формы (n, 16): в разы компактнее
+        списка bytes и позволяет выбирать ID векторной индексацией.
+        """
         logger.info("Получение пула сертификатов из базы данных...")
 
         if connection is None:
@@ -200,8 +297,9 @@ class CertificateGenerator:
         try:
             cursor = connection.cursor()
             cursor.execute("SELECT certificate_id FROM certificates")
-            rows = cursor.fetchall()
-            certificate_ids = [row[0] for row in rows]
+            certificate_ids = np.frombuffer(
+                b"".join(row[0] for row in cursor), dtype=np.uint8
+            ).reshape(-1, 16)
 
             logger.info(
                 f"Получено {len(certificate_ids):,} ID сертификатов из базы данных"
@@ -216,7 +314,7 @@ class CertificateGenerator:
 def main():
     """Основная функция с высокопроизводительной обработкой"""
     logger.info("=== Запуск системы управления сертификатами ===")
-    MemoryMonitor.log_memory_usage("старт")
+    MemoryMonitor.log_memory_usage("старт", force=True)
 
     try:
         # Получаем параметры из переменных окружения или используем значения по умолчанию
@@ -251,7 +349,9 @@ def main():
             num_certificates=num_certificates,
         )
         db.connect()
-        db.create_tables()
+        db.create_tables(with_indexes=False)
+        # Вся генерация - одна транзакция без fsync, как в API
+        db.begin_bulk_load()
         MemoryMonitor.log_memory_usage("инициализация")
 
         # 3. Потоковая генерация и запись клиентов
@@ -283,27 +383,20 @@ def main():
         db._flush_certificates()
         certificate_pool = generator.get_certificate_pool(db.connection)
 
-        # Батчевая обработка назначений
-        assignment_batch_size = generator.batch_size
-        for start_id in tqdm(
-            range(1, num_clients + 1, assignment_batch_size), desc="Назначения"
+        # Назначения строятся в потоках, запись в БД - в этом потоке
+        num_batches = -(-num_clients // generator.batch_size)
+        for assignments in tqdm(
+            generator.generate_assignments_parallel(certificate_pool),
+            total=num_batches,
+            desc="Назначения",
         ):
-            end_id = min(start_id + assignment_batch_size, num_clients + 1)
-            client_ids = list(range(start_id, end_id))
-
-            assignments = generator.generate_assignments_batch(
-                client_ids, certificate_pool
-            )
-            db.insert_assignments_batch(assignments)
-
-            # Очистка памяти каждые 10 батчей
-            if (start_id // assignment_batch_size) % 10 == 0:
-                gc.collect()
+            db.insert_assignments_direct(assignments)
 
         MemoryMonitor.log_memory_usage("назначения")
 
-        # 6. Финальный сброс буферов
-        db.flush_all()
+        # 6. Финальный сброс буферов, COMMIT и возврат WAL-настроек для чтения
+        db.end_bulk_load()
+        db.create_indexes()
 
         # 7. Потоковое получение активных сертификатов
         logger.info("=== Потоковое получение активных сертификатов ===")
@@ -311,23 +404,15 @@ def main():
         Path(output_dir).mkdir(exist_ok=True)
 
         active_certs_file = f"{output_dir}/active_certificates.csv"
-        total_active = 0
-
-        with open(active_certs_file, "w", encoding="utf-8") as f:
-            f.write("client_id,certificate_id,expiry_date,days_until_expiry\n")
-
-            for chunk_df in db.get_active_certificates_streaming():
-                chunk_df.to_csv(f, header=False, index=False)
-                total_active += len(chunk_df)
-
-                if total_active % 100000 == 0:
-                    logger.info(f"Обработано {total_active:,} активных сертификатов")
+        # Отдельное соединение только на чтение с большим mmap; кортежи
+        # курсора пишутся csv.writer напрямую, без DataFrame на чанк
+        total_active = export_active_certificates_csv(db.db_path, active_certs_file)
 
         logger.info(f"Всего активных сертификатов: {total_active:,}")
         logger.info(f"Результат сохранен в {active_certs_file}")
 
         # 8. Статистика производительности
-        MemoryMonitor.log_memory_usage("завершение")
+        MemoryMonitor.log_memory_usage("завершение", force=True)
 
         db.close()
         logger.info("=== Высокопроизводительная обработка завершена успешно ===")
@@ -1,3 +1,13 @@
-from .database import StreamingCertificateDatabase
+from .database import (
+    StreamingCertificateDatabase,
+    certificate_id_sql,
+    export_active_certificates_csv,
+    to_julian_day,
+)
 
-__all__ = ["StreamingCertificateDatabase"]
+__all__ = [
+    "StreamingCertificateDatabase",
+    "certificate_id_sql",
+    "export_active_certificates_csv",
+    "to_julian_day",
+]
@@ -4,13 +4,235 @@
 """
 import os
 import sqlite3
+import sys
 import threading
-from datetime import datetime
-from typing import Dict, Iterator, List
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+from functools import lru_cache
+from itertools import chain, islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
 import pandas as pd
 
-from ..utils import SystemOptimizer, logger
+from ..utils import (
+    BACKEND_INMEM,
+    BACKEND_STREAMING,
+    SystemOptimizer,
+    gzip_copy,
+    logger,
+    write_active_certificates_csv,
+)
+
+# Смещение между date.toordinal() и юлианским днем (полдень даты)
+JULIAN_DAY_OFFSET = 1721425
+
+# Настройки соединения для обычной работы
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",  # Write-Ahead Logging
+    "PRAGMA synchronous = NORMAL",  # Баланс скорости/надежности
+    "PRAGMA cache_size = -64000",  # 64MB кэш
+    "PRAGMA temp_store = MEMORY",  # Временные таблицы в памяти
+    "PRAGMA mmap_size = 268435456",  # 256MB memory-mapped I/O
+    "PRAGMA wal_autocheckpoint = 1000",  # По умолчанию SQLite
+)
+
+# Настройки на время массовой загрузки: без fsync и с большим кэшем.
+# locking_mode = EXCLUSIVE не используется, чтобы API мог читать БД
+# во время генерации
+BULK_LOAD_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -524288",  # 512MB кэш
+    "PRAGMA mmap_size = 8589934592",  # 8GB memory-mapped I/O
+    "PRAGMA wal_autocheckpoint = 0",  # Checkpoint только явный, раз в фиксацию
+)
+
+# Промежуточный COMMIT и checkpoint при массовой загрузке, чтобы WAL не рос
+# без ограничений
+BULK_COMMIT_ROWS = 2_000_000
+
+# Настройки читающего соединения выгрузки: весь проход по индексу идет
+# через mmap из страничного кэша ОС, без копирования в кэш страниц SQLite
+EXPORT_PRAGMAS = (
+    "PRAGMA query_only = ON",
+    "PRAGMA cache_size = -262144",  # 256MB кэш
+    "PRAGMA mmap_size = 8589934592",  # 8GB memory-mapped I/O
+)
+
+# Лимит host-параметров в одном выражении (SQLITE_MAX_VARIABLE_NUMBER старых сборок)
+MAX_SQL_PARAMS = 999
+
+# Заголовки INSERT для сброса буферов; VALUES добавляет _insert_multi_row
+INSERT_CLIENTS_SQL = "INSERT OR REPLACE INTO clients (client_id)"
+INSERT_CERTIFICATES_SQL = "INSERT OR REPLACE INTO certificates (certificate_id)"
+INSERT_ASSIGNMENTS_SQL = (
+    "INSERT INTO client_certificates"
+    " (client_id, certificate_id, expiry_date, expiry_julian)"
+)
+
+
+def to_julian_day(value: date) -> int:
+    """Перевод даты в целый юлианский день (совпадает с julianday(date) + 0.5)"""
+    return value.toordinal() + JULIAN_DAY_OFFSET
+
+
+@lru_cache(maxsize=16384)
+def _expiry_columns(expiry_date: Union[date, str]) -> Tuple[str, int]:
+    """
+    ISO-строка и юлианский день срока действия для строки назначения.
+
+    Различных дат в генерации - тысячи на миллионы строк, поэтому перевод
+    кэшируется; дата принимается объектом date или строкой ISO.
+    """
+    if isinstance(expiry_date, str):
+        expiry_date = date.fromisoformat(expiry_date)
+    return expiry_date.isoformat(), to_julian_day(expiry_date)
+
+
+def certificate_id_sql(column: str) -> str:
+    """
+    SQL-выражение строки UUID для certificate_id.
+
+    ID хранятся 16-байтным BLOB и форматируются только при выдаче;
+    текстовые ID (БД старого формата) возвращаются как есть.
+    """
+    parts = " || '-' || ".join(
+        f"substr(hex({column}), {start}, {length})"
+        for start, length in ((1, 8), (9, 4), (13, 4), (17, 4), (21, 12))
+    )
+    return f"CASE WHEN typeof({column}) = 'blob' THEN lower({parts}) ELSE {column} END"
+
+
+def _uuid_bytes(value):
+    """16 байт UUID из строки; прочие значения (и не-UUID строки) без изменений"""
+    if isinstance(value, str):
+        try:
+            return uuid.UUID(value).bytes
+        except ValueError:
+            return value
+    return value
+
+
+@lru_cache(maxsize=None)
+def _multi_row_insert_sql(insert_sql: str, width: int, rows: int) -> str:
+    """Текст INSERT ... VALUES (?, ...), (?, ...) на заданное число строк"""
+    row = "(" + ", ".join("?" * width) + ")"
+    return f"{insert_sql} VALUES " + ", ".join([row] * rows)
+
+
+def _row_size_bytes(row: Tuple) -> int:
+    """Размер строки в памяти: кортеж вместе со значениями"""
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+
+
+def _insert_multi_row(
+    cursor: sqlite3.Cursor, insert_sql: str, rows: Sequence[Tuple]
+) -> None:
+    """
+    Вставка строк пачками по несколько кортежей в одном VALUES.
+
+    Полные пачки идут одним executemany с одинаковым текстом запроса,
+    поэтому sqlite3 подготавливает выражение один раз; остаток - отдельным
+    execute.
+    """
+    if not rows:
+        return
+
+    width = len(rows[0])
+    per_statement = MAX_SQL_PARAMS // width
+    full = len(rows) - len(rows) % per_statement
+
+    if full:
+        cursor.executemany(
+            _multi_row_insert_sql(insert_sql, width, per_statement),
+            (
+                tuple(chain.from_iterable(rows[i : i + per_statement]))
+                for i in range(0, full, per_statement)
+            ),
+        )
+    if full < len(rows):
+        tail = rows[full:]
+        cursor.execute(
+            _multi_row_insert_sql(insert_sql, width, len(tail)),
+            tuple(chain.from_iterable(tail)),
+        )
+
+
+def _iter_active_rows(
+    connection: sqlite3.Connection,
+    today_jd: int,
+    chunk_size: int,
+    expiry_julian: str = "cc.expiry_julian",
+) -> Iterator[List[tuple]]:
+    """
+    Чанки кортежей (client_id, certificate_id, expiry_date, days) активных.
+
+    expiry_julian - SQL-выражение дня истечения для client_certificates cc:
+    читающие соединения API передают вычисление из expiry_date для баз,
+    созданных до появления колонки expiry_julian.
+    """
+    cursor = connection.cursor()
+    cursor.row_factory = None
+    cursor.execute(
+        f"""
+        SELECT
+            cc.client_id,
+            {certificate_id_sql("cc.certificate_id")},
+            cc.expiry_date,
+            {expiry_julian} - ?
+        FROM client_certificates cc
+        WHERE {expiry_julian} > ?
+        ORDER BY cc.client_id, {expiry_julian}
+    """,
+        (today_jd, today_jd),
+    )
+
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def export_active_certificates_csv(
+    db_path: str,
+    output_path: str,
+    today_jd: int = None,
+    chunk_size: int = 50000,
+    compress: bool = False,
+) -> int:
+    """
+    Выгрузка отчета по активным сертификатам через собственное соединение.
+
+    Функция уровня модуля, чтобы ее можно было запускать в отдельном
+    процессе: в WAL читатель не мешает закрытию и VACUUM основного соединения.
+    Соединение открывается только на чтение (mode=ro) с большим mmap.
+    При compress рядом создается сжатая копия output_path.gz для выдачи
+    клиентам с Accept-Encoding: gzip.
+    """
+    if today_jd is None:
+        today_jd = to_julian_day(datetime.now().date())
+
+    connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        for pragma in EXPORT_PRAGMAS:
+            connection.execute(pragma)
+        total = write_active_certificates_csv(
+            _iter_active_rows(connection, today_jd, chunk_size), output_path
+        )
+    finally:
+        connection.close()
+
+    if compress:
+        gzip_copy(output_path)
+
+    logger.info(f"Отчет {output_path} записан: {total:,} активных сертификатов")
+    return total
 
 
 class StreamingCertificateDatabase:
@@ -40,45 +262,78 @@ class StreamingCertificateDatabase:
             )
             self.write_buffer_size = optimal_settings["write_buffer_size"]
             self.chunk_size = optimal_settings["chunk_size"]
+            self.backend = optimal_settings["backend"]
         else:
             logger.info("Не используется автоматическая оптимизация:")
             self.write_buffer_size = write_buffer_size
             self.chunk_size = 50000  # Значение по умолчанию
+            self.backend = BACKEND_STREAMING
 
-        self.connection = None
+        self.connection: Optional[sqlite3.Connection] = None
+        # Один курсор на все сбросы буферов и транзакции загрузки
+        self._write_cursor: Optional[sqlite3.Cursor] = None
         self._write_lock = threading.Lock()
 
-        # Буферы для батчевой записи
-        self._client_buffer: List[Dict] = []
-        self._certificate_buffer: List[Dict] = []
-        self._assignment_buffer: List[Dict] = []
+        # Режим массовой загрузки: одна внешняя транзакция вместо COMMIT на батч
+        self._bulk_load = False
+        self._bulk_pending_rows = 0
+        # Сброс внутри общей транзакции flush_all: COMMIT делает она
+        self._outer_transaction = False
+
+        # Буферы для батчевой записи: строки хранятся готовыми кортежами
+        # параметров, и сброс передает буфер в SQLite без перепаковки
+        self._client_buffer: List[Tuple] = []
+        self._certificate_buffer: List[Tuple] = []
+        self._assignment_buffer: List[Tuple] = []
 
     def connect(self):
         """Подключение с оптимизацией для больших данных"""
         try:
             self.connection = sqlite3.connect(
-                self.db_path, check_same_thread=False, timeout=30.0
+                self.db_path,
+                check_same_thread=False,
+                timeout=30.0,
+                cached_statements=256,
+                isolation_level="DEFERRED",
             )
-            self.connection.row_factory = sqlite3.Row
+            # Без row_factory: строки - обычные кортежи, которые без
+            # перепаковки уходят в csv.writer и в пул сертификатов
+            self._write_cursor = self.connection.cursor()
 
             # Оптимизация SQLite для больших данных
             cursor = self.connection.cursor()
-            cursor.execute("PRAGMA journal_mode = WAL")  # Write-Ahead Logging
-            cursor.execute("PRAGMA synchronous = NORMAL")  # Баланс скорости/надежности
-            cursor.execute("PRAGMA cache_size = -64000")  # 64MB кэш
-            cursor.execute("PRAGMA temp_store = MEMORY")  # Временные таблицы в памяти
-            cursor.execute("PRAGMA mmap_size = 268435456")  # 256MB memory-mapped I/O
+            for pragma in CONNECTION_PRAGMAS:
+                cursor.execute(pragma)
 
             logger.info(f"Подключение к БД {self.db_path} с оптимизацией")
         except Exception as e:
             logger.error(f"Ошибка подключения к БД: {e}")
             raise
 
-    def create_tables(self):
-        """Создание таблиц с оптимизированными индексами"""
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """Открытое соединение; до connect() - явная ошибка вместо обращения к None"""
+        if self.connection is None:
+            raise sqlite3.ProgrammingError("Нет соединения с БД: вызовите connect()")
+        return self.connection
+
+    @property
+    def _cursor(self) -> sqlite3.Cursor:
+        """Курсор записи; до connect() - явная ошибка вместо обращения к None"""
+        if self._write_cursor is None:
+            raise sqlite3.ProgrammingError("Нет соединения с БД: вызовите connect()")
+        return self._write_cursor
+
+    def create_tables(self, with_indexes: bool = True):
+        """
+        Создание таблиц с оптимизированными индексами.
+
+        При массовой загрузке индексы выгоднее построить один раз после
+        вставки (with_indexes=False, затем create_indexes), чем обновлять
+        их на каждую строку.
+        """
+        cursor = self._conn.cursor()
         try:
-            cursor = self.connection.cursor()
-
             # Отключаем автокоммит для ускорения
             cursor.execute("BEGIN TRANSACTION")
 
@@ -95,7 +350,7 @@ class StreamingCertificateDatabase:
             cursor.execute(
                 """
                 CREATE TABLE IF NOT EXISTS certificates (
-                    certificate_id TEXT PRIMARY KEY
+                    certificate_id BLOB PRIMARY KEY
                 ) WITHOUT ROWID
             """
             )
@@ -106,57 +361,312 @@ class StreamingCertificateDatabase:
                 CREATE TABLE IF NOT EXISTS client_certificates (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     client_id INTEGER NOT NULL,
-                    certificate_id TEXT NOT NULL,
+                    certificate_id BLOB NOT NULL,
                     expiry_date DATE NOT NULL,
+                    expiry_julian INTEGER,
                     FOREIGN KEY (client_id) REFERENCES clients (client_id),
                     FOREIGN KEY (certificate_id) REFERENCES certificates (certificate_id)
                 )
             """
             )
 
-            # Составные индексы для оптимизации запросов
+            self._migrate_expiry_julian(cursor)
+            self._migrate_certificate_ids(cursor)
+
+            # Итоги генерации: списочные запросы без фильтров не считают COUNT(*)
             cursor.execute(
                 """
-                CREATE INDEX IF NOT EXISTS idx_client_cert_expiry_composite
-                ON client_certificates(client_id, expiry_date, certificate_id)
+                CREATE TABLE IF NOT EXISTS meta (
+                    k TEXT PRIMARY KEY,
+                    v INTEGER
+                )
             """
             )
-            cursor.execute(
-                """
-                CREATE INDEX IF NOT EXISTS idx_expiry_date
-                ON client_certificates(expiry_date)
+
+            if with_indexes:
+                self._create_indexes(cursor)
+
+            cursor.execute("COMMIT")
+            logger.info("Таблицы созданы" + (" с индексами" if with_indexes else ""))
+
+        except Exception as e:
+            cursor.execute("ROLLBACK")
+            logger.error(f"Ошибка создания таблиц: {e}")
+            raise
+
+    def _create_indexes(self, cursor: sqlite3.Cursor):
+        """Создание индексов client_certificates"""
+        # Составные индексы для оптимизации запросов: покрывают выборки
+        # по целому юлианскому дню без обращения к таблице
+        cursor.execute(
             """
+            CREATE INDEX IF NOT EXISTS idx_client_cert_expiry_composite
+            ON client_certificates(
+                client_id, expiry_julian, certificate_id, expiry_date
             )
+        """
+        )
+        # Запросы не фильтруют и не сортируют по expiry_date: индекс
+        # старых БД только замедляет загрузку
+        cursor.execute("DROP INDEX IF EXISTS idx_expiry_date")
+        # Покрывающий индекс для выборок по сроку действия без обращения к таблице
+        cursor.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_cc_expiry_covering
+            ON client_certificates(
+                expiry_julian, client_id, certificate_id, expiry_date
+            )
+        """
+        )
 
+    def create_indexes(self):
+        """Построение индексов после массовой загрузки"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("BEGIN TRANSACTION")
+            self._create_indexes(cursor)
             cursor.execute("COMMIT")
-            logger.info("Таблицы и индексы созданы")
+            logger.info("Индексы построены")
 
         except Exception as e:
             cursor.execute("ROLLBACK")
-            logger.error(f"Ошибка создания таблиц: {e}")
+            logger.error(f"Ошибка создания индексов: {e}")
             raise
 
-    def insert_clients_batch(self, clients: List[Dict]):
-        """Потоковая вставка клиентов"""
+    def _migrate_expiry_julian(self, cursor: sqlite3.Cursor):
+        """Добавление колонки expiry_julian в БД, созданные до ее появления"""
+        columns = [
+            row[1] for row in cursor.execute("PRAGMA table_info(client_certificates)")
+        ]
+        if "expiry_julian" in columns:
+            return
+
+        logger.info("Миграция: добавление колонки expiry_julian")
+        cursor.execute(
+            "ALTER TABLE client_certificates ADD COLUMN expiry_julian INTEGER"
+        )
+        cursor.execute(
+            """
+            UPDATE client_certificates
+            SET expiry_julian = CAST(julianday(expiry_date) + 0.5 AS INTEGER)
+        """
+        )
+        # Старые версии индексов не содержат expiry_julian - пересоздаем
+        cursor.execute("DROP INDEX IF EXISTS idx_client_cert_expiry_composite")
+        cursor.execute("DROP INDEX IF EXISTS idx_cc_expiry_covering")
+
+    def _migrate_certificate_ids(self, cursor: sqlite3.Cursor):
+        """
+        Перевод текстовых certificate_id (БД старого формата) в 16-байтный BLOB.
+
+        CREATE TABLE IF NOT EXISTS оставляет в старой БД колонку TEXT, а пул
+        сертификатов и новые назначения работают с BLOB. Таблица certificates
+        пересоздается с колонкой BLOB - это же признак выполненной миграции;
+        в client_certificates значения заменяются на месте.
+        """
+        columns = {
+            row[1]: row[2] for row in cursor.execute("PRAGMA table_info(certificates)")
+        }
+        if columns.get("certificate_id", "").upper() != "TEXT":
+            return
+
+        logger.info("Миграция: перевод certificate_id в BLOB")
+        cursor.connection.create_function(
+            "uuid_bytes", 1, _uuid_bytes, deterministic=True
+        )
+        cursor.execute(
+            """
+            CREATE TABLE certificates_blob (
+                certificate_id BLOB PRIMARY KEY
+            ) WITHOUT ROWID
+        """
+        )
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO certificates_blob (certificate_id)
+            SELECT uuid_bytes(certificate_id) FROM certificates
+        """
+        )
+        cursor.execute("DROP TABLE certificates")
+        cursor.execute("ALTER TABLE certificates_blob RENAME TO certificates")
+        cursor.execute(
+            """
+            UPDATE client_certificates
+            SET certificate_id = uuid_bytes(certificate_id)
+            WHERE typeof(certificate_id) = 'text'
+        """
+        )
+
+    def begin_bulk_load(self):
+        """Начало массовой загрузки в одной транзакции без fsync"""
+        cursor = self._cursor
+        for pragma in BULK_LOAD_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.execute("BEGIN IMMEDIATE")
+
+        self._bulk_load = True
+        self._bulk_pending_rows = 0
+        logger.info(f"Режим массовой загрузки включен ({self.backend})")
+
+    def end_bulk_load(self):
+        """Сброс буферов, единственный COMMIT и возврат обычных настроек"""
+        self.flush_all()
+
+        cursor = self._cursor
+        if self._bulk_load:
+            cursor.execute("COMMIT")
+            self._bulk_load = False
+            # Весь WAL загрузки переносится в файл БД одним checkpoint
+            cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        for pragma in CONNECTION_PRAGMAS:
+            cursor.execute(pragma)
+        logger.info("Режим массовой загрузки завершен")
+
+    @contextmanager
+    def _flush_transaction(self, rows_written: int) -> Iterator[sqlite3.Cursor]:
+        """
+        Транзакция сброса буфера.
+
+        Вне режима загрузки COMMIT/ROLLBACK выполняет сам контекст соединения;
+        в режиме загрузки транзакция общая и фиксируется раз в BULK_COMMIT_ROWS
+        строк, а ошибка откатывает всю загрузку. Если данные помещаются
+        в память (BACKEND_INMEM), промежуточных фиксаций нет вовсе.
+        Внутри flush_all фиксирует его общая транзакция.
+        """
+        cursor = self._cursor
+        if self._outer_transaction:
+            yield cursor
+            return
+
+        if not self._bulk_load:
+            with self._conn:
+                yield cursor
+            return
+
+        try:
+            yield cursor
+        except Exception:
+            cursor.execute("ROLLBACK")
+            self._bulk_load = False
+            raise
+
+        if self.backend == BACKEND_INMEM:
+            return
+
+        self._bulk_pending_rows += rows_written
+        if self._bulk_pending_rows >= BULK_COMMIT_ROWS:
+            cursor.execute("COMMIT")
+            # PASSIVE не ждет читателей API; WAL переиспользуется с начала
+            cursor.execute("PRAGMA wal_checkpoint(PASSIVE)")
+            cursor.execute("BEGIN IMMEDIATE")
+            self._bulk_pending_rows = 0
+
+    def insert_clients_batch(self, clients: List[Tuple[int]]):
+        """Потоковая вставка клиентов: кортежи (client_id,)"""
         self._client_buffer.extend(clients)
 
         if len(self._client_buffer) >= self.write_buffer_size:
             self._flush_clients()
 
-    def insert_certificates_batch(self, certificates: List[Dict]):
-        """Потоковая вставка сертификатов"""
+    def insert_certificates_batch(self, certificates: List[Tuple[bytes]]):
+        """Потоковая вставка сертификатов: кортежи (certificate_id,)"""
         self._certificate_buffer.extend(certificates)
 
         if len(self._certificate_buffer) >= self.write_buffer_size:
             self._flush_certificates()
 
-    def insert_assignments_batch(self, assignments: List[Dict]):
-        """Потоковая вставка назначений"""
-        self._assignment_buffer.extend(assignments)
+    def insert_assignments_batch(
+        self, assignments: Sequence[Tuple[int, bytes, Union[date, str]]]
+    ):
+        """
+        Потоковая вставка назначений: (client_id, certificate_id, expiry_date).
+
+        Дата (date или строка ISO от генератора) кладется в буфер строкой ISO:
+        это то же значение, что пишет адаптер date модуля sqlite3 (устаревший
+        с Python 3.12), но без поиска и вызова адаптера на каждую строку.
+        """
+        self._assignment_buffer.extend(
+            (client_id, certificate_id, *_expiry_columns(expiry_date))
+            for client_id, certificate_id, expiry_date in assignments
+        )
 
         if len(self._assignment_buffer) >= self.write_buffer_size:
             self._flush_assignments()
 
+    def insert_assignments_direct(
+        self, assignments: Sequence[Tuple[int, bytes, Union[date, str]]]
+    ):
+        """
+        Вставка батча назначений сразу в БД, минуя буфер.
+
+        Для батчей генератора, которые и так не меньше буфера записи:
+        строки не копируются в буфер и не держатся в памяти второй раз.
+        """
+        if not assignments:
+            return
+
+        # Порядок вставки сохраняется: сначала то, что уже накоплено в буфере
+        self._flush_assignments()
+
+        rows = [
+            (client_id, certificate_id, *_expiry_columns(expiry_date))
+            for client_id, certificate_id, expiry_date in assignments
+        ]
+        with self._write_lock:
+            try:
+                with self._flush_transaction(len(rows)) as cursor:
+                    _insert_multi_row(cursor, INSERT_ASSIGNMENTS_SQL, rows)
+
+                logger.info(f"Записано {len(rows):,} назначений")
+                SystemOptimizer.observe_record_size(_row_size_bytes(rows[0]))
+
+            except Exception as e:
+                logger.error(f"Ошибка записи назначений: {e}")
+                raise
+
+    def insert_clients_bulk(self, clients: Iterable[Tuple[int]]) -> int:
+        """Вставка клиентов из итератора (например, всех батчей генератора)"""
+        self._flush_clients()
+        return self._insert_bulk(INSERT_CLIENTS_SQL, clients, "клиентов")
+
+    def insert_certificates_bulk(self, certificates: Iterable[Tuple[bytes]]) -> int:
+        """Вставка сертификатов из итератора (например, всех батчей генератора)"""
+        self._flush_certificates()
+        return self._insert_bulk(INSERT_CERTIFICATES_SQL, certificates, "сертификатов")
+
+    def _insert_bulk(self, insert_sql: str, rows: Iterable[Tuple], name: str) -> int:
+        """
+        Потоковая вставка строк итератора одной транзакцией.
+
+        Строки читаются кусками по write_buffer_size и целиком в памяти не
+        собираются. В режиме массовой загрузки куски входят в общую
+        транзакцию с обычными промежуточными фиксациями.
+        """
+        rows = iter(rows)
+        chunks = iter(lambda: list(islice(rows, self.write_buffer_size)), [])
+        total = 0
+
+        with self._write_lock:
+            try:
+                if self._bulk_load:
+                    for chunk in chunks:
+                        with self._flush_transaction(len(chunk)) as cursor:
+                            _insert_multi_row(cursor, insert_sql, chunk)
+                        total += len(chunk)
+                else:
+                    with self._conn:
+                        for chunk in chunks:
+                            _insert_multi_row(self._cursor, insert_sql, chunk)
+                            total += len(chunk)
+
+                logger.info(f"Записано {total:,} {name}")
+                return total
+
+            except Exception as e:
+                logger.error(f"Ошибка записи {name}: {e}")
+                raise
+
     def _flush_clients(self):
         """Сброс буфера клиентов в БД"""
         if not self._client_buffer:
@@ -164,22 +674,14 @@ class StreamingCertificateDatabase:
 
         with self._write_lock:
             try:
-                cursor = self.connection.cursor()
-                cursor.execute("BEGIN TRANSACTION")
-
-                cursor.executemany(
-                    """
-                    INSERT OR REPLACE INTO clients (client_id) VALUES (?)
-                """,
-                    [(client["client_id"],) for client in self._client_buffer],
-                )
+                with self._flush_transaction(len(self._client_buffer)) as cursor:
+                    _insert_multi_row(cursor, INSERT_CLIENTS_SQL, self._client_buffer)
 
-                cursor.execute("COMMIT")
                 logger.info(f"Записано {len(self._client_buffer):,} клиентов")
-                self._client_buffer.clear()
+                if not self._outer_transaction:
+                    self._client_buffer.clear()
 
             except Exception as e:
-                cursor.execute("ROLLBACK")
                 logger.error(f"Ошибка записи клиентов: {e}")
                 raise
 
@@ -190,22 +692,16 @@ class StreamingCertificateDatabase:
 
         with self._write_lock:
             try:
-                cursor = self.connection.cursor()
-                cursor.execute("BEGIN TRANSACTION")
-
-                cursor.executemany(
-                    """
-                    INSERT OR REPLACE INTO certificates (certificate_id) VALUES (?)
-                """,
-                    [(cert["certificate_id"],) for cert in self._certificate_buffer],
-                )
+                with self._flush_transaction(len(self._certificate_buffer)) as cursor:
+                    _insert_multi_row(
+                        cursor, INSERT_CERTIFICATES_SQL, self._certificate_buffer
+                    )
 
-                cursor.execute("COMMIT")
                 logger.info(f"Записано {len(self._certificate_buffer):,} сертификатов")
-                self._certificate_buffer.clear()
+                if not self._outer_transaction:
+                    self._certificate_buffer.clear()
 
             except Exception as e:
-                cursor.execute("ROLLBACK")
                 logger.error(f"Ошибка записи сертификатов: {e}")
                 raise
 
@@ -216,35 +712,43 @@ class StreamingCertificateDatabase:
 
         with self._write_lock:
             try:
-                cursor = self.connection.cursor()
-                cursor.execute("BEGIN TRANSACTION")
-
-                cursor.executemany(
-                    """
-                    INSERT INTO client_certificates
-                    (client_id, certificate_id, expiry_date) VALUES (?, ?, ?)
-                """,
-                    [
-                        (a["client_id"], a["certificate_id"], a["expiry_date"])
-                        for a in self._assignment_buffer
-                    ],
-                )
+                with self._flush_transaction(len(self._assignment_buffer)) as cursor:
+                    _insert_multi_row(
+                        cursor, INSERT_ASSIGNMENTS_SQL, self._assignment_buffer
+                    )
 
-                cursor.execute("COMMIT")
                 logger.info(f"Записано {len(self._assignment_buffer):,} назначений")
-                self._assignment_buffer.clear()
+                SystemOptimizer.observe_record_size(
+                    _row_size_bytes(self._assignment_buffer[0])
+                )
+                if not self._outer_transaction:
+                    self._assignment_buffer.clear()
 
             except Exception as e:
-                cursor.execute("ROLLBACK")
                 logger.error(f"Ошибка записи назначений: {e}")
                 raise
 
     def flush_all(self):
         """Принудительный сброс всех буферов"""
         logger.info("Финальный сброс всех буферов...")
-        self._flush_clients()
-        self._flush_certificates()
-        self._flush_assignments()
+        if self._bulk_load or self.connection is None:
+            self._flush_clients()
+            self._flush_certificates()
+            self._flush_assignments()
+        else:
+            # Три буфера - одна транзакция и один COMMIT вместо трех. Буферы
+            # очищаются только после COMMIT: при откате строки остаются в них
+            self._outer_transaction = True
+            try:
+                with self.connection:
+                    self._flush_clients()
+                    self._flush_certificates()
+                    self._flush_assignments()
+            finally:
+                self._outer_transaction = False
+            self._client_buffer.clear()
+            self._certificate_buffer.clear()
+            self._assignment_buffer.clear()
         logger.info("Все буферы сброшены")
 
     def get_active_certificates_streaming(
@@ -255,32 +759,60 @@ class StreamingCertificateDatabase:
             chunk_size = self.chunk_size
 
         try:
-            current_date = datetime.now().date()
-            query = """
+            today_jd = to_julian_day(datetime.now().date())
+            # Разность целых юлианских дней: pandas сразу получает колонку int64
+            # без NaN, и приводить days_until_expiry построчно не нужно.
+            # Keyset-пагинация по составному индексу вместо OFFSET: каждый
+            # чанк начинается с поиска в индексе после последней строки,
+            # а не с пропуска всех уже выданных строк. Все колонки есть в
+            # client_certificates, поэтому JOIN не нужен: запрос читает
+            # только покрывающий индекс
+            query = f"""
                 SELECT
-                    c.client_id,
-                    cert.certificate_id,
+                    cc.client_id,
+                    {certificate_id_sql("cc.certificate_id")} as certificate_id,
                     cc.expiry_date,
-                    ROUND((julianday(cc.expiry_date) - julianday(date('now'))), 0) as days_until_expiry
-                FROM clients c
-                JOIN client_certificates cc ON c.client_id = cc.client_id
-                JOIN certificates cert ON cc.certificate_id = cert.certificate_id
-                WHERE cc.expiry_date > ?
-                ORDER BY c.client_id, cc.expiry_date
-                LIMIT ? OFFSET ?
+                    cc.expiry_julian - ? as days_until_expiry,
+                    cc.expiry_julian as seek_julian,
+                    cc.certificate_id as seek_certificate_id,
+                    cc.id as seek_id
+                FROM client_certificates cc
+                WHERE cc.expiry_julian > ?
+                    AND (
+                        cc.client_id, cc.expiry_julian, cc.certificate_id,
+                        cc.expiry_date, cc.id
+                    ) > (?, ?, ?, ?, ?)
+                ORDER BY
+                    cc.client_id, cc.expiry_julian, cc.certificate_id,
+                    cc.expiry_date, cc.id
+                LIMIT ?
             """
+            seek_columns = ["seek_julian", "seek_certificate_id", "seek_id"]
 
-            offset = 0
+            # client_id = -1 меньше любого реального, остальное не важно
+            seek = (-1, 0, b"", "", 0)
             while True:
                 df = pd.read_sql_query(
-                    query, self.connection, params=[current_date, chunk_size, offset]
+                    query,
+                    self.connection,
+                    params=[today_jd, today_jd, *seek, chunk_size],
+                    # client_id не больше 10 млн (GenerationRequest), дней до
+                    # истечения - не больше ~20 лет: int32 вдвое компактнее
+                    dtype={"client_id": "int32", "days_until_expiry": "int32"},
                 )
 
                 if df.empty:
                     break
 
-                yield df
-                offset += chunk_size
+                last = df.iloc[-1]
+                seek = (
+                    int(last["client_id"]),
+                    int(last["seek_julian"]),
+                    last["seek_certificate_id"],
+                    last["expiry_date"],
+                    int(last["seek_id"]),
+                )
+                yield df.drop(columns=seek_columns)
 
                 if len(df) < chunk_size:  # Последний чанк
                     break
@@ -289,6 +821,40 @@ class StreamingCertificateDatabase:
             logger.error(f"Ошибка потокового запроса: {e}")
             raise
 
+    def store_totals(self, today_jd: int = None) -> Dict[str, int]:
+        """Подсчет итогов генерации и сохранение их в таблицу meta"""
+        if today_jd is None:
+            today_jd = to_julian_day(datetime.now().date())
+
+        connection = self._conn
+        cursor = connection.cursor()
+
+        def count(query: str, params: tuple = ()) -> int:
+            return cursor.execute(query, params).fetchone()[0]
+
+        totals = {
+            "total_clients": count("SELECT COUNT(*) FROM clients"),
+            "total_assignments": count("SELECT COUNT(*) FROM client_certificates"),
+            # Активность зависит от даты, поэтому хранится вместе с ней
+            "total_active": count(
+                "SELECT COUNT(*) FROM client_certificates WHERE expiry_julian > ?",
+                (today_jd,),
+            ),
+            "active_as_of_jd": today_jd,
+        }
+
+        with connection:
+            cursor.executemany(
+                "INSERT OR REPLACE INTO meta (k, v) VALUES (?, ?)", totals.items()
+            )
+        logger.info(f"Итоги генерации сохранены: {totals}")
+
+        if totals["total_clients"]:
+            SystemOptimizer.observe_assignments_per_client(
+                totals["total_assignments"] / totals["total_clients"]
+            )
+        return totals
+
     def close(self):
         """Закрытие с финальным сбросом буферов"""
         self.flush_all()
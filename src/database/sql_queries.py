@@ -9,6 +9,8 @@ from datetime import datetime
 
 import pandas as pd
 
+from .database import certificate_id_sql, to_julian_day
+
 logger = logging.getLogger(__name__)
 
 
@@ -33,18 +35,16 @@ class CertificateQueries:
         """
         ОСНОВНОЙ ЗАПРОС: Получение активных сертификатов для всех пользователей
         """
-        current_date = datetime.now().date()
-        query = """
+        today_jd = to_julian_day(datetime.now().date())
+        query = f"""
             SELECT
                 cc.client_id,
-                cc.certificate_id,
+                {certificate_id_sql("cc.certificate_id")} as certificate_id,
                 cc.expiry_date,
-                ROUND((julianday(cc.expiry_date) - julianday(?)), 0) as days_until_expiry
+                cc.expiry_julian - ? as days_until_expiry
             FROM client_certificates cc
-            WHERE cc.expiry_date > ?
-            ORDER BY cc.client_id, cc.expiry_date
+            WHERE cc.expiry_julian > ?
+            ORDER BY cc.client_id, cc.expiry_julian
         """
 
-        return pd.read_sql_query(
-            query, self.connection, params=[current_date, current_date]
-        )
+        return pd.read_sql_query(query, self.connection, params=[today_jd, today_jd])
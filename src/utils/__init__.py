@@ -1,5 +1,21 @@
+from .csv_export import (
+    ACTIVE_CERTIFICATES_HEADER,
+    gzip_copy,
+    write_active_certificates_csv,
+)
 from .memory_monitor import MemoryMonitor
 from .my_logger import logger
-from .optimizer import SystemOptimizer
+from .optimizer import BACKEND_INMEM, BACKEND_STREAMING, SystemOptimizer
+from .ttl_cache import ttl_cache
 
-__all__ = ["MemoryMonitor", "SystemOptimizer", "logger"]
+__all__ = [
+    "ACTIVE_CERTIFICATES_HEADER",
+    "BACKEND_INMEM",
+    "BACKEND_STREAMING",
+    "MemoryMonitor",
+    "SystemOptimizer",
+    "gzip_copy",
+    "logger",
+    "ttl_cache",
+    "write_active_certificates_csv",
+]
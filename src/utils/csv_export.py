@@ -1,8 +1,20 @@
+import csv
+import gzip
 import os
+import shutil
+import uuid
 from pathlib import Path
+from typing import Iterable, List
 
 from .my_logger import logger
 
+ACTIVE_CERTIFICATES_HEADER = (
+    "client_id",
+    "certificate_id",
+    "expiry_date",
+    "days_until_expiry",
+)
+
 
 def save_to_csv_streaming(data_generator, output_dir: str = None):
     """Потоковое сохранение в CSV без загрузки всех данных в память"""
@@ -18,8 +30,8 @@ def save_to_csv_streaming(data_generator, output_dir: str = None):
             f.write("client_id\n")  # Заголовок
 
             for batch in data_generator.generate_clients_parallel():
-                for client in batch:
-                    f.write(f"{client['client_id']}\n")
+                for (client_id,) in batch:
+                    f.write(f"{client_id}\n")
 
         logger.info(f"Клиенты сохранены в {clients_file}")
 
@@ -29,11 +41,57 @@ def save_to_csv_streaming(data_generator, output_dir: str = None):
             f.write("certificate_id\n")  # Заголовок
 
             for batch in data_generator.generate_certificates_parallel():
-                for cert in batch:
-                    f.write(f"{cert['certificate_id']}\n")
+                for (cert_id,) in batch:
+                    f.write(f"{uuid.UUID(bytes=cert_id)}\n")
 
         logger.info(f"Сертификаты сохранены в {certificates_file}")
 
     except Exception as e:
         logger.error(f"Ошибка потокового сохранения в CSV: {e}")
         raise
+
+
+def write_active_certificates_csv(row_chunks: Iterable[List[tuple]], path: str) -> int:
+    """
+    Запись отчета по активным сертификатам из чанков кортежей курсора.
+
+    Файл пишется во временный path.tmp и атомарно переименовывается,
+    поэтому /certificates/active/download не отдаст недописанный отчет.
+    Сжатая копия прошлого отчета (path.gz) удаляется до переименования.
+    """
+    tmp_path = f"{path}.tmp"
+    total = 0
+    try:
+        with open(tmp_path, "w", encoding="utf-8", newline="", buffering=1 << 20) as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(ACTIVE_CERTIFICATES_HEADER)
+
+            for rows in row_chunks:
+                writer.writerows(rows)
+                total += len(rows)
+
+        # Копия прошлого отчета не должна пережить замену самого отчета
+        try:
+            os.remove(f"{path}.gz")
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return total
+
+
+def gzip_copy(path: str, compresslevel: int = 1) -> str:
+    """Сжатая копия файла рядом с ним (path.gz), заменяется атомарно"""
+    gz_path = f"{path}.gz"
+    tmp_path = f"{gz_path}.tmp"
+    with open(path, "rb") as src, gzip.open(
+        tmp_path, "wb", compresslevel=compresslevel
+    ) as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+
+    os.replace(tmp_path, gz_path)
+    return gz_path
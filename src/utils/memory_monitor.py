@@ -1,19 +1,66 @@
+import os
+import time
+from typing import Optional
+
 import psutil
 
 from .my_logger import logger
 
+STATM_PATH = "/proc/self/statm"
+
+# Объект текущего процесса создается один раз: psutil.Process() на каждый
+# замер заново открывает /proc/<pid>. После fork пересоздается по pid
+_process: Optional[psutil.Process] = None
+
+
+def current_process() -> psutil.Process:
+    """Объект psutil текущего процесса"""
+    global _process
+    if _process is None or _process.pid != os.getpid():
+        _process = psutil.Process()
+    return _process
+
+
+def _read_statm_rss() -> Optional[int]:
+    """
+    RSS процесса в байтах из /proc/self/statm (второе поле, в страницах).
+    None, если файла нет (не Linux).
+    """
+    try:
+        with open(STATM_PATH, "rb") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def current_rss_bytes() -> int:
+    """RSS процесса в байтах; psutil только если /proc/self/statm недоступен"""
+    rss = _read_statm_rss()
+    if rss is None:
+        return current_process().memory_info().rss
+    return rss
+
 
 class MemoryMonitor:
     """Мониторинг использования памяти"""
 
+    # Не чаще одной записи в MIN_INTERVAL секунд, кроме force=True
+    MIN_INTERVAL = 1.0
+    _last_log = float("-inf")
+
     @staticmethod
     def get_memory_usage():
         """Получение текущего использования памяти в MB"""
-        process = psutil.Process()
-        return process.memory_info().rss / 1024 / 1024
+        return current_rss_bytes() / 1024 / 1024
 
     @staticmethod
-    def log_memory_usage(operation: str):
-        """Логирование использования памяти"""
+    def log_memory_usage(operation: str, force: bool = False):
+        """Логирование использования памяти с ограничением частоты"""
+        now = time.monotonic()
+        if not force and now - MemoryMonitor._last_log < MemoryMonitor.MIN_INTERVAL:
+            return
+        MemoryMonitor._last_log = now
+
         memory_mb = MemoryMonitor.get_memory_usage()
         logger.info(f"Память после {operation}: {memory_mb:.2f} MB")
@@ -1,32 +1,254 @@
+import os
+import sys
+from bisect import bisect_right
+from functools import lru_cache
 from multiprocessing import cpu_count
-from typing import Dict
+from typing import Dict, Optional, Tuple
 
 import psutil
 
+MEMINFO_PATH = "/proc/meminfo"
+
+_MB = 1 << 20
+_GB = 1 << 30
+
+# Размер строк в БД для оценки объема данных, байт
+CLIENT_ROW_BYTES = 50
+CERTIFICATE_ROW_BYTES = 100
+ASSIGNMENT_ROW_BYTES = 150
+
+# Целевой объем батча: 15% свободной памяти, в MB на каждый свободный GB
+TARGET_BATCH_MB_PER_GB = 0.15 * 1024
+
+# Начальная оценка размера одной записи в памяти (до наблюдений)
+ESTIMATED_RECORD_SIZE_BYTES = 200
+
+# Запас по памяти для батчей всех потоков: доля свободной памяти,
+# постоянные накладные расходы потока и множитель на копии записи
+# (кортежи, буфер записи, параметры SQLite)
+BATCH_MEMORY_FRACTION = 0.7
+WORKER_OVERHEAD_BYTES = 4096
+RECORD_OVERHEAD_FACTOR = 1.3
+
+# Режим загрузки: если рабочий набор с накладными расходами занимает не больше
+# INMEM_MEMORY_FRACTION свободной памяти, данные держатся в памяти до конца
+# загрузки, иначе пишутся потоково с промежуточными фиксациями
+BACKEND_INMEM = "inmem"
+BACKEND_STREAMING = "streaming"
+INMEM_MEMORY_FRACTION = 0.4
+
+# Оценки, уточняемые по фактическим загрузкам: новое наблюдение входит
+# в экспоненциальное среднее с весом EWMA_ALPHA
+EWMA_ALPHA = 0.2
+_observed: Dict[str, Optional[float]] = {
+    "record_size_bytes": float(ESTIMATED_RECORD_SIZE_BYTES),
+    "assignments_per_client": None,
+}
+
+# Шаг округления свободной памяти в ключе кэша get_optimal_settings
+AVAILABLE_MEMORY_BUCKET_GB = 0.5
+
+# Кусочные таблицы вместо цепочек if/elif: индекс интервала ищется bisect.
+# Потолок потоков по оценке объема данных в GB
+_WORKER_BOUNDS_GB = (1, 10, 100)
+_WORKER_CAPS = (4, 8, 12, sys.maxsize)
+
+# Размер чанка по числу назначений: делитель и границы для каждого интервала
+_CHUNK_BOUNDS = (50_000, 500_000, 5_000_000, 50_000_000)
+_CHUNK_DIVS = (5, 10, 20, 50, 100)
+_CHUNK_MINS = (1_000, 5_000, 10_000, 25_000, 50_000)
+_CHUNK_MAXES = (10_000, 25_000, 50_000, 100_000, 200_000)
+
+# Предел батча по числу клиентов: границы общего объема RAM в GB,
+# минимальный предел и делитель числа клиентов для каждого интервала
+_CLIENTS_LIMIT_BOUNDS_GB = (2, 8, 32)
+_CLIENTS_LIMIT_MINS = (1_000, 5_000, 10_000, 50_000)
+_CLIENTS_LIMIT_DIVS = (200, 100, 50, 20)
+
+
+def _read_meminfo() -> Optional[Dict[str, int]]:
+    """
+    MemTotal и MemAvailable из /proc/meminfo в байтах.
+
+    Обе строки в начале файла, поэтому читаются первые 256 байт вместо
+    полного разбора psutil. None, если файла нет (не Linux) или формат другой.
+    """
+    try:
+        with open(MEMINFO_PATH, "rb") as f:
+            head = f.read(256)
+    except OSError:
+        return None
+
+    values = {}
+    for line in head.split(b"\n"):
+        key, _, rest = line.partition(b":")
+        if key in (b"MemTotal", b"MemAvailable"):
+            values[key.decode()] = int(rest.split()[0]) * 1024
+
+    return values if len(values) == 2 else None
+
+
+def _available_memory_gb() -> float:
+    """Свободная память в GB; psutil только если /proc/meminfo недоступен"""
+    meminfo = _read_meminfo()
+    if meminfo is None:
+        return psutil.virtual_memory().available / _GB
+    return meminfo["MemAvailable"] / _GB
+
+
+def _cpu_affinity(logical_cores: int) -> int:
+    """
+    Число ядер, доступных процессу: маска affinity (cpuset контейнера)
+    и лимиты Slurm, если задача запущена под ним.
+    """
+    try:
+        available = len(os.sched_getaffinity(0))
+    except AttributeError:  # нет на macOS/Windows
+        available = logical_cores
+
+    for variable in ("SLURM_CPUS_PER_TASK", "SLURM_CPUS_ON_NODE"):
+        value = os.getenv(variable, "")
+        if value.isdigit() and int(value) > 0:
+            return min(available, int(value))
+    return available
+
+
+def _observe(key: str, value: float):
+    """Обновление наблюдаемой оценки экспоненциальным сглаживанием"""
+    previous = _observed[key]
+    if previous is None:
+        _observed[key] = float(value)
+    else:
+        _observed[key] = (1 - EWMA_ALPHA) * previous + EWMA_ALPHA * value
+
+
+def _observed_record_size() -> float:
+    """Наблюдаемый размер записи; без наблюдений - ESTIMATED_RECORD_SIZE_BYTES"""
+    record_size_bytes = _observed["record_size_bytes"]
+    if record_size_bytes is None:
+        return float(ESTIMATED_RECORD_SIZE_BYTES)
+    return record_size_bytes
+
+
+def _memory_bucket(available_memory_gb: float) -> float:
+    """
+    Свободная память, округленная вниз до корзины (ключ кэша настроек).
+    Округление вниз сохраняет запас по памяти при расчете батча.
+    """
+    if available_memory_gb < AVAILABLE_MEMORY_BUCKET_GB:
+        return round(available_memory_gb, 2)
+    return (
+        available_memory_gb // AVAILABLE_MEMORY_BUCKET_GB * AVAILABLE_MEMORY_BUCKET_GB
+    )
+
+
+@lru_cache(maxsize=None)
+def _static_system_info() -> Tuple[int, int, int, float]:
+    """
+    Логические, физические и доступные процессу ядра и общий объем
+    памяти в GB: не меняются после загрузки системы.
+    """
+    logical_cores = cpu_count()
+    physical_cores = psutil.cpu_count(logical=False) or logical_cores
+    affinity = _cpu_affinity(logical_cores)
+
+    meminfo = _read_meminfo()
+    if meminfo is None:
+        memory_gb = psutil.virtual_memory().total / _GB
+    else:
+        memory_gb = meminfo["MemTotal"] / _GB
+
+    return logical_cores, physical_cores, affinity, memory_gb
+
 
 class SystemOptimizer:
     """Автоматическая оптимизация параметров на основе характеристик системы"""
 
     @staticmethod
     def get_optimal_settings(num_clients: int, num_certificates: int) -> Dict:
-        """Автоматическое определение оптимальных настроек"""
-        system_info = SystemOptimizer._get_system_info()
+        """
+        Автоматическое определение оптимальных настроек.
+
+        Расчет кэшируется: свободная память округляется вниз до корзины
+        AVAILABLE_MEMORY_BUCKET_GB, и одинаковые запросы на той же машине
+        получают копию готового результата.
+        """
+        # Ключ кэша собирается из кортежа напрямую, без промежуточного
+        # словаря _get_system_info: на попадании в кэш это весь расчет
+        logical_cores, physical_cores, affinity, memory_gb = _static_system_info()
+        assignments_per_client = _observed["assignments_per_client"]
+        return dict(
+            SystemOptimizer._compute_settings(
+                num_clients,
+                num_certificates,
+                logical_cores,
+                physical_cores,
+                affinity,
+                memory_gb,
+                _memory_bucket(_available_memory_gb()),
+                round(_observed_record_size()),
+                None
+                if assignments_per_client is None
+                else round(assignments_per_client, 1),
+            )
+        )
+
+    @staticmethod
+    def observe_record_size(bytes_per_record: float):
+        """Учет фактического размера записи в памяти после сброса буфера"""
+        _observe("record_size_bytes", bytes_per_record)
+
+    @staticmethod
+    def observe_assignments_per_client(assignments_per_client: float):
+        """Учет фактического числа назначений на клиента после генерации"""
+        _observe("assignments_per_client", assignments_per_client)
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _compute_settings(
+        num_clients: int,
+        num_certificates: int,
+        cpu_cores: int,
+        cpu_cores_physical: int,
+        cpu_affinity: int,
+        memory_gb: float,
+        available_memory_gb: float,
+        record_size_bytes: float,
+        assignments_per_client: float,
+    ) -> Dict:
+        """Расчет настроек по характеристикам системы (кэшируемая часть)"""
+        system_info = {
+            "cpu_cores": cpu_cores,
+            "cpu_cores_physical": cpu_cores_physical,
+            "cpu_affinity": cpu_affinity,
+            "memory_gb": memory_gb,
+            "available_memory_gb": available_memory_gb,
+        }
         data_estimates = SystemOptimizer._estimate_data_size(
-            num_clients, num_certificates
+            num_clients, num_certificates, available_memory_gb, assignments_per_client
         )
 
+        # Генерация упирается в CPU: гиперпотоки и ядра вне affinity не помогают
         num_workers = SystemOptimizer._calculate_optimal_workers(
-            data_estimates["estimated_data_size_gb"], system_info["cpu_cores"]
+            data_estimates["estimated_data_size_gb"],
+            min(cpu_cores_physical, cpu_affinity),
         )
         batch_size = SystemOptimizer._calculate_optimal_batch_size(
-            system_info, data_estimates, num_clients
+            system_info, data_estimates, num_clients, num_workers, record_size_bytes
         )
         write_buffer_size = SystemOptimizer._calculate_write_buffer_size(batch_size)
+        backend = SystemOptimizer._select_backend(
+            data_estimates["estimated_data_size_gb"], available_memory_gb
+        )
+        if backend == BACKEND_INMEM:
+            # Весь батч уходит в БД одним сбросом
+            write_buffer_size = batch_size
         chunk_size = SystemOptimizer._calculate_chunk_size(
             data_estimates["total_possible_assignments"]
         )
 
         return {
+            "backend": backend,
             "num_workers": num_workers,
             "batch_size": batch_size,
             "write_buffer_size": write_buffer_size,
@@ -40,28 +262,47 @@ class SystemOptimizer:
 
     @staticmethod
     def _get_system_info() -> Dict:
-        """Получение информации о системе"""
+        """Получение информации о системе; заново читается только свободная память"""
+        logical_cores, physical_cores, affinity, memory_gb = _static_system_info()
         return {
-            "cpu_cores": cpu_count(),
-            "memory_gb": psutil.virtual_memory().total / (1024**3),
-            "available_memory_gb": psutil.virtual_memory().available / (1024**3),
+            "cpu_cores": logical_cores,
+            "cpu_cores_physical": physical_cores,
+            "cpu_affinity": affinity,
+            "memory_gb": memory_gb,
+            "available_memory_gb": _available_memory_gb(),
         }
 
     @staticmethod
-    def _estimate_data_size(num_clients: int, num_certificates: int) -> Dict:
-        """Оценка размера данных"""
-        avg_certs_per_client = (
-            min(10, num_certificates / num_clients) if num_clients > 0 else 10
-        )
+    def _estimate_data_size(
+        num_clients: int,
+        num_certificates: int,
+        available_memory_gb: float = None,
+        assignments_per_client: float = None,
+    ) -> Dict:
+        """
+        Оценка размера данных; свободная память берется из system_info, если есть.
+        Число назначений на клиента - наблюдаемое по прошлым генерациям,
+        а до первой генерации - априорная оценка.
+        """
+        if assignments_per_client is None:
+            assignments_per_client = _observed["assignments_per_client"]
+
+        if assignments_per_client is not None:
+            avg_certs_per_client = min(assignments_per_client, num_certificates)
+        else:
+            avg_certs_per_client = (
+                min(10, num_certificates / num_clients) if num_clients > 0 else 10
+            )
         estimated_data_size_gb = (
-            (num_clients * 50)
-            + (num_certificates * 100)
-            + (num_clients * avg_certs_per_client * 150)
-        ) / (1024**3)
+            num_clients * CLIENT_ROW_BYTES
+            + num_certificates * CERTIFICATE_ROW_BYTES
+            + num_clients * avg_certs_per_client * ASSIGNMENT_ROW_BYTES
+        ) / _GB
 
-        available_memory_gb = psutil.virtual_memory().available / (1024**3)
+        if available_memory_gb is None:
+            available_memory_gb = _available_memory_gb()
         target_memory_per_batch_mb = max(
-            10, min(250, available_memory_gb * 1024 * 0.15)
+            10, min(250, available_memory_gb * TARGET_BATCH_MB_PER_GB)
         )
 
         return {
@@ -76,40 +317,61 @@ class SystemOptimizer:
         estimated_data_size_gb: float, cpu_cores: int
     ) -> int:
         """Расчет оптимального количества потоков"""
-        if estimated_data_size_gb < 1:
-            return min(cpu_cores, 4)
-        elif estimated_data_size_gb < 10:
-            return min(cpu_cores, 8)
-        elif estimated_data_size_gb < 100:
-            return min(cpu_cores, 12)
-        else:
-            return cpu_cores
+        i = bisect_right(_WORKER_BOUNDS_GB, estimated_data_size_gb)
+        return min(cpu_cores, _WORKER_CAPS[i])
 
     @staticmethod
     def _calculate_optimal_batch_size(
-        system_info: Dict, data_estimates: Dict, num_clients: int
+        system_info: Dict,
+        data_estimates: Dict,
+        num_clients: int,
+        num_workers: int = 1,
+        record_size_bytes: float = None,
     ) -> int:
-        """Расчет оптимального размера батча"""
+        """
+        Расчет оптимального размера батча.
+
+        Батчи всех потоков вместе с накладными расходами должны укладываться
+        в BATCH_MEMORY_FRACTION свободной памяти; этот предел заменяет
+        фиксированные потолки по объему RAM. Размер записи - наблюдаемый
+        (observe_record_size), если не передан явно.
+        """
+        if record_size_bytes is None:
+            record_size_bytes = _observed_record_size()
+
         memory_gb = system_info["memory_gb"]
         target_memory_per_batch_mb = data_estimates["target_memory_per_batch_mb"]
 
-        # Примерный размер одной записи в памяти
-        estimated_record_size_bytes = 200
         optimal_batch_from_memory = int(
-            target_memory_per_batch_mb * 1024 * 1024 / estimated_record_size_bytes
+            target_memory_per_batch_mb * _MB / record_size_bytes
         )
 
-        # Ограничиваем batch_size разумными пределами
-        if memory_gb < 2:
-            return min(optimal_batch_from_memory, 5000, max(1000, num_clients // 200))
-        elif memory_gb < 8:
-            return min(optimal_batch_from_memory, 50000, max(5000, num_clients // 100))
-        elif memory_gb < 32:
-            return min(optimal_batch_from_memory, 200000, max(10000, num_clients // 50))
-        else:
-            return min(
-                optimal_batch_from_memory, 1000000, max(50000, num_clients // 20)
-            )
+        available_bytes = system_info["available_memory_gb"] * _GB
+        per_worker_bytes = BATCH_MEMORY_FRACTION * available_bytes / max(1, num_workers)
+        max_batch_from_memory = int(
+            (per_worker_bytes - WORKER_OVERHEAD_BYTES)
+            / (RECORD_OVERHEAD_FACTOR * record_size_bytes)
+        )
+
+        # Предел по числу клиентов в зависимости от объема RAM
+        i = bisect_right(_CLIENTS_LIMIT_BOUNDS_GB, memory_gb)
+        clients_limit = max(
+            _CLIENTS_LIMIT_MINS[i], num_clients // _CLIENTS_LIMIT_DIVS[i]
+        )
+
+        return max(
+            1, min(optimal_batch_from_memory, clients_limit, max_batch_from_memory)
+        )
+
+    @staticmethod
+    def _select_backend(
+        estimated_data_size_gb: float, available_memory_gb: float
+    ) -> str:
+        """Выбор режима загрузки по рабочему набору и свободной памяти"""
+        working_set_gb = RECORD_OVERHEAD_FACTOR * estimated_data_size_gb
+        if working_set_gb <= INMEM_MEMORY_FRACTION * available_memory_gb:
+            return BACKEND_INMEM
+        return BACKEND_STREAMING
 
     @staticmethod
     def _calculate_write_buffer_size(batch_size: int) -> int:
@@ -119,13 +381,8 @@ class SystemOptimizer:
     @staticmethod
     def _calculate_chunk_size(total_possible_assignments: float) -> int:
         """Расчет размера чанка"""
-        if total_possible_assignments < 50000:
-            return min(10000, max(1000, int(total_possible_assignments // 5)))
-        elif total_possible_assignments < 500000:
-            return min(25000, max(5000, int(total_possible_assignments // 10)))
-        elif total_possible_assignments < 5000000:
-            return min(50000, max(10000, int(total_possible_assignments // 20)))
-        elif total_possible_assignments < 50000000:
-            return min(100000, max(25000, int(total_possible_assignments // 50)))
-        else:
-            return min(200000, max(50000, int(total_possible_assignments // 100)))
+        i = bisect_right(_CHUNK_BOUNDS, total_possible_assignments)
+        return min(
+            _CHUNK_MAXES[i],
+            max(_CHUNK_MINS[i], int(total_possible_assignments // _CHUNK_DIVS[i])),
+        )
@@ -0,0 +1,43 @@
+import threading
+import time
+from functools import update_wrapper
+from typing import Any, Callable, Dict, Generic, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class _TTLCached(Generic[T]):
+    """Обертка функции с кэшем на ttl секунд и методом cache_clear"""
+
+    def __init__(self, func: Callable[..., T], ttl: float):
+        self._func = func
+        self._ttl = ttl
+        self._cache: Dict[Tuple, Tuple[float, T]] = {}
+        self._lock = threading.Lock()
+        update_wrapper(self, func)
+
+    def __call__(self, *args: Any) -> T:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(args)
+            if cached is not None and now - cached[0] < self._ttl:
+                return cached[1]
+
+        value = self._func(*args)
+        with self._lock:
+            self._cache[args] = (now, value)
+        return value
+
+    def cache_clear(self) -> None:
+        """Сброс всех закэшированных значений"""
+        with self._lock:
+            self._cache.clear()
+
+
+def ttl_cache(ttl: float) -> Callable[[Callable[..., T]], _TTLCached[T]]:
+    """Кэширование результата функции на ttl секунд (ключ - позиционные аргументы)"""
+
+    def decorator(func: Callable[..., T]) -> _TTLCached[T]:
+        return _TTLCached(func, ttl)
+
+    return decorator
@@ -4,19 +4,39 @@
 """
 
 import pytest
+import gzip
 import json
+import os
+import sqlite3
+from datetime import date, timedelta
 from unittest.mock import patch, MagicMock
 from fastapi.testclient import TestClient
 
-from src.api.handlers import app, generation_status
+from src.api.handlers import (
+    GenerationState,
+    app,
+    generation_status,
+    run_generation_task,
+    _active_certificates_page,
+    _stream_active_certificates_csv,
+)
+from src.api.models import GenerationRequest
+from src.database import StreamingCertificateDatabase
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def client():
-    """HTTP клиент для тестирования"""
+    """HTTP клиент для тестирования: один на модуль"""
     return TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def reset_generation_status():
+    """Сброс общего состояния генерации после каждого теста"""
+    yield
+    generation_status.update(**GenerationState().snapshot())
+
+
 class TestHealthCheck:
     """Тесты для health check"""
 
@@ -95,17 +115,24 @@ class TestGenerationAPI:
         
         assert response.status_code == 422  # Validation error
 
-    @patch('src.api.handlers.generation_status')
-    def test_start_generation_already_running(self, mock_status, client):
+    @patch.object(generation_status, 'is_running', True)
+    def test_start_generation_already_running(self, client):
         """Тест запуска генерации когда она уже выполняется"""
-        mock_status.__getitem__.return_value = True  # is_running = True
-        
         response = client.post("/generation/start")
         
         assert response.status_code == 409  # Conflict
         data = response.json()
         assert "уже выполняется" in data["detail"]
 
+    def test_generation_state_snapshot(self):
+        """Тест согласованного снимка состояния генерации"""
+        generation_status.update(progress=5, total=10, current_stage="Тест")
+        snapshot = generation_status.snapshot()
+
+        assert snapshot["progress"] == 5
+        assert snapshot["current_stage"] == "Тест"
+        assert "_lock" not in snapshot
+
 
 class TestActiveCertificatesAPI:
     """Тесты для API активных сертификатов"""
@@ -171,16 +198,69 @@ class TestActiveCertificatesAPI:
         
         assert response.status_code == 422  # Validation error
 
+    @patch('os.path.exists', return_value=True)
+    def test_get_active_certificates_invalid_cursor(self, mock_exists, client):
+        """Тест с некорректным курсором keyset-пагинации"""
+        response = client.get("/certificates/active?cursor=not-a-cursor")
+
+        assert response.status_code == 400
+
+    @patch('src.api.handlers._active_certificates_page', return_value=b'{"page": 1}')
+    @patch('src.api.handlers._db_version', return_value=42)
+    @patch('os.path.exists', return_value=True)
+    def test_get_active_certificates_etag(
+        self, mock_exists, mock_version, mock_page, client
+    ):
+        """Тест ETag и ответа 304 для неизмененной БД"""
+        response = client.get("/certificates/active")
+
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+
+        response = client.get(
+            "/certificates/active", headers={"If-None-Match": etag}
+        )
+
+        assert response.status_code == 304
+        assert mock_page.call_count == 1
+
 
 class TestDownloadAPI:
     """Тесты для API скачивания отчетов"""
 
-    @patch('os.path.exists', return_value=True)
-    def test_download_active_certificates_file_exists(self, mock_exists, client):
+    def test_download_active_certificates_file_exists(self, api_db_dir, client):
         """Тест скачивания отчета когда файл существует"""
+        (api_db_dir / "output").mkdir()
+        (api_db_dir / "output" / "active_certificates.csv").write_text("report\n")
+
         response = client.get("/certificates/active/download")
-        
+
+        assert response.status_code == 200
+        assert response.text == "report\n"
+        assert "content-encoding" not in response.headers
+
+    def test_download_active_certificates_gzip(self, api_db_dir, client):
+        """Тест выдачи сжатой копии: только если она не старше отчета"""
+        csv_path = api_db_dir / "output" / "active_certificates.csv"
+        gz_path = api_db_dir / "output" / "active_certificates.csv.gz"
+        (api_db_dir / "output").mkdir()
+        csv_path.write_text("report\n")
+        gz_path.write_bytes(gzip.compress(b"report\n"))
+
+        response = client.get("/certificates/active/download")
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.text == "report\n"
+
+        # Копия прошлой генерации, пока сжимается новый отчет
+        mtime = os.stat(csv_path).st_mtime_ns
+        os.utime(gz_path, ns=(mtime - 10**9, mtime - 10**9))
+
+        response = client.get("/certificates/active/download")
+
         assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+        assert response.text == "report\n"
 
     @patch('os.path.exists', return_value=False)
     def test_download_active_certificates_file_not_exists(self, mock_exists, client):
@@ -191,6 +271,29 @@ class TestDownloadAPI:
         data = response.json()
         assert "не найден" in data["detail"]
 
+    @patch('os.path.exists', return_value=False)
+    def test_stream_active_certificates_no_database(self, mock_exists, client):
+        """Тест потоковой выгрузки без базы данных"""
+        response = client.get("/certificates/active/stream")
+
+        assert response.status_code == 404
+
+    def test_stream_active_certificates_csv(self, test_db_with_data):
+        """Тест генератора потоковой выгрузки CSV"""
+        today = date.today()
+        test_db_with_data.insert_assignments_batch([
+            (1, "cert-1", today + timedelta(days=7)),
+            (2, "cert-2", today - timedelta(days=7)),
+        ])
+        test_db_with_data.flush_all()
+
+        content = "".join(_stream_active_certificates_csv(test_db_with_data.db_path))
+
+        assert content.splitlines() == [
+            "client_id,certificate_id,expiry_date,days_until_expiry",
+            f"1,cert-1,{today + timedelta(days=7)},7",
+        ]
+
 
 class TestClientCertificateAssignmentsAPI:
     """Тесты для API связей клиент-сертификат"""
@@ -230,6 +333,118 @@ class TestClientCertificateAssignmentsAPI:
         assert response.status_code == 200
 
 
+@pytest.fixture
+def api_db_dir(tmp_path, monkeypatch):
+    """Рабочая директория с собственной data/ для обработчиков API"""
+    (tmp_path / "data").mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+class TestKeysetPagination:
+    """Тесты keyset-пагинации и чтения БД старого формата"""
+
+    def test_cursor_pages_cover_duplicate_keys(self, api_db_dir, client):
+        """Тест обхода по курсору при повторяющихся (клиент, срок, сертификат)"""
+        expiry = date.today() + timedelta(days=30)
+        db = StreamingCertificateDatabase(
+            db_path="data/certificates.db", write_buffer_size=100
+        )
+        db.connect()
+        db.create_tables()
+        # Повторная генерация в ту же БД дает одинаковые ключи индекса
+        db.insert_assignments_batch(
+            [(client_id, b"\x01" * 16, expiry) for client_id in (1, 1, 1, 2, 2)]
+        )
+        db.close()
+
+        for url in ("/certificates/active", "/client-certificates"):
+            seen = 0
+            cursor = None
+            while True:
+                params = {"page_size": 2, "limit": 2}
+                if cursor:
+                    params["cursor"] = cursor
+                response = client.get(url, params=params)
+                assert response.status_code == 200
+                data = response.json()
+                rows = data.get("certificates", data.get("assignments"))
+                seen += len(rows)
+                cursor = data["next_cursor"]
+                if cursor is None:
+                    break
+
+            assert seen == 5
+
+    def test_read_database_without_expiry_julian(self, api_db_dir, client):
+        """Тест чтения БД, созданной до появления колонки expiry_julian"""
+        expiry = date.today() + timedelta(days=7)
+        connection = sqlite3.connect("data/certificates.db")
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute(
+            """
+            CREATE TABLE client_certificates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_id INTEGER NOT NULL,
+                certificate_id TEXT NOT NULL,
+                expiry_date DATE NOT NULL
+            )
+        """
+        )
+        connection.execute(
+            "INSERT INTO client_certificates (client_id, certificate_id, expiry_date)"
+            " VALUES (1, 'cert-1', ?), (1, 'cert-2', ?)",
+            (expiry.isoformat(), (date.today() - timedelta(days=7)).isoformat()),
+        )
+        connection.commit()
+        connection.close()
+
+        response = client.get("/certificates/active")
+        assert response.status_code == 200
+        assert [
+            (c["certificate_id"], c["days_until_expiry"])
+            for c in response.json()["certificates"]
+        ] == [("cert-1", 7)]
+
+        response = client.get("/client-certificates?limit=1")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["assignments"][0]["days_until_expiry"] == 7
+
+        response = client.get(
+            f"/client-certificates?limit=1&cursor={data['next_cursor']}"
+        )
+        assert response.status_code == 200
+        assert response.json()["assignments"][0]["is_active"] is False
+
+        response = client.get("/certificates/active/stream")
+        assert response.status_code == 200
+        assert response.text.splitlines()[1:] == [f"1,cert-1,{expiry},7"]
+
+
+class TestActivePageCache:
+    """Тесты кэша страниц /certificates/active"""
+
+    @patch('src.api.handlers.report_executor')
+    def test_cache_cleared_after_generation(self, mock_executor, api_db_dir, client):
+        """Тест сброса кэша страниц по завершении генерации"""
+        request = GenerationRequest(
+            num_clients=10,
+            num_certificates=20,
+            batch_size=100,
+            num_workers=2,
+            write_buffer_size=100,
+        )
+        run_generation_task(request)
+        assert client.get("/certificates/active").status_code == 200
+        assert _active_certificates_page.cache_info().currsize > 0
+
+        run_generation_task(request)
+
+        assert _active_certificates_page.cache_info().currsize == 0
+        assert generation_status.snapshot()["error"] is None
+
+
 class TestRequestValidation:
     """Тесты для валидации запросов"""
 
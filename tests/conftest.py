@@ -4,9 +4,11 @@
 """
 
 import os
+import shutil
 import sqlite3
 import tempfile
 from pathlib import Path
+from types import SimpleNamespace
 from typing import Generator
 
 import pytest
@@ -14,12 +16,50 @@ from fastapi.testclient import TestClient
 
 from src.api.handlers import app
 from src.database import StreamingCertificateDatabase
+from src.utils.optimizer import (
+    ESTIMATED_RECORD_SIZE_BYTES,
+    SystemOptimizer,
+    _static_system_info,
+)
+
+
+@pytest.fixture(autouse=True)
+def fake_sysinfo(monkeypatch):
+    """
+    Детерминированная система для SystemOptimizer: 8 ядер, 16GB памяти,
+    8GB свободно. /proc и psutil хоста не читаются, кэши и наблюдаемые
+    оценки не переходят между тестами
+    """
+    memory = SimpleNamespace(total=16 * 1024**3, available=8 * 1024**3)
+    monkeypatch.setattr("src.utils.optimizer._read_meminfo", lambda: None)
+    monkeypatch.setattr("src.utils.optimizer.psutil.virtual_memory", lambda: memory)
+    monkeypatch.setattr(
+        "src.utils.optimizer.psutil.cpu_count", lambda logical=True: 8
+    )
+    monkeypatch.setattr("src.utils.optimizer.cpu_count", lambda: 8)
+    monkeypatch.setattr("src.utils.optimizer._cpu_affinity", lambda cores: cores)
+    monkeypatch.setattr(
+        "src.utils.optimizer._observed",
+        {
+            "record_size_bytes": float(ESTIMATED_RECORD_SIZE_BYTES),
+            "assignments_per_client": None,
+        },
+    )
+
+    _static_system_info.cache_clear()
+    SystemOptimizer._compute_settings.cache_clear()
+    yield
+    _static_system_info.cache_clear()
+    SystemOptimizer._compute_settings.cache_clear()
 
 
 @pytest.fixture
 def temp_db_path() -> Generator[str, None, None]:
-    """Временная база данных для тестов"""
-    with tempfile.NamedTemporaryFile(suffix=".db", delete=False) as tmp:
+    """Временная база данных для тестов; имя с id воркера pytest-xdist"""
+    worker_id = os.environ.get("PYTEST_XDIST_WORKER", "gw0")
+    with tempfile.NamedTemporaryFile(
+        prefix=f"{worker_id}-", suffix=".db", delete=False
+    ) as tmp:
         db_path = tmp.name
     
     yield db_path
@@ -36,9 +76,24 @@ def temp_output_dir() -> Generator[str, None, None]:
         yield tmp_dir
 
 
+@pytest.fixture(scope="session")
+def schema_db_path(tmp_path_factory) -> str:
+    """Пустая база со схемой: создается один раз за сессию и копируется в тесты"""
+    db_path = str(tmp_path_factory.mktemp("schema") / "schema.db")
+    db = StreamingCertificateDatabase(db_path=db_path, write_buffer_size=100)
+    db.connect()
+    db.create_tables()
+    db.close()
+    return db_path
+
+
 @pytest.fixture
-def test_db(temp_db_path: str) -> Generator[StreamingCertificateDatabase, None, None]:
-    """База данных для тестов"""
+def test_db(
+    temp_db_path: str, schema_db_path: str
+) -> Generator[StreamingCertificateDatabase, None, None]:
+    """База данных для тестов: своя копия готовой схемы на каждый тест"""
+    shutil.copyfile(schema_db_path, temp_db_path)
+
     db = StreamingCertificateDatabase(
         db_path=temp_db_path,
         write_buffer_size=100,  # Маленький буфер для тестов
@@ -46,7 +101,6 @@ def test_db(temp_db_path: str) -> Generator[StreamingCertificateDatabase, None,
         num_certificates=20
     )
     db.connect()
-    db.create_tables()
     
     yield db
     
@@ -57,8 +111,8 @@ def test_db(temp_db_path: str) -> Generator[StreamingCertificateDatabase, None,
 def test_db_with_data(test_db: StreamingCertificateDatabase) -> StreamingCertificateDatabase:
     """База данных с тестовыми данными"""
     # Добавляем тестовые данные
-    clients = [{"client_id": i} for i in range(1, 6)]
-    certificates = [{"certificate_id": f"cert-{i}"} for i in range(1, 11)]
+    clients = [(i,) for i in range(1, 6)]
+    certificates = [(f"cert-{i}",) for i in range(1, 11)]
     
     test_db.insert_clients_batch(clients)
     test_db.insert_certificates_batch(certificates)
@@ -67,9 +121,9 @@ def test_db_with_data(test_db: StreamingCertificateDatabase) -> StreamingCertifi
     return test_db
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def api_client() -> TestClient:
-    """HTTP клиент для тестирования API"""
+    """HTTP клиент для тестирования API: один на модуль"""
     return TestClient(app)
 
 
@@ -7,6 +7,7 @@ import pytest
 import sqlite3
 import tempfile
 import os
+from itertools import chain
 from pathlib import Path
 
 from src.core.data_generator import CertificateGenerator
@@ -49,19 +50,17 @@ class TestFullWorkflow:
             db.connect()
             db.create_tables()
             
-            # 3. Генерация и сохранение клиентов
-            client_count = 0
-            for batch in generator.generate_clients_parallel():
-                db.insert_clients_batch(batch)
-                client_count += len(batch)
+            # 3. Генерация и сохранение клиентов: все батчи одной транзакцией
+            client_count = db.insert_clients_bulk(
+                chain.from_iterable(generator.generate_clients_parallel())
+            )
             
             assert client_count == num_clients
             
             # 4. Генерация и сохранение сертификатов
-            cert_count = 0
-            for batch in generator.generate_certificates_parallel():
-                db.insert_certificates_batch(batch)
-                cert_count += len(batch)
+            cert_count = db.insert_certificates_bulk(
+                chain.from_iterable(generator.generate_certificates_parallel())
+            )
             
             assert cert_count == num_certificates
             
@@ -72,17 +71,11 @@ class TestFullWorkflow:
             certificate_pool = generator.get_certificate_pool(connection=db.connection)
             assert len(certificate_pool) == num_certificates
             
-            total_assignments = 0
-            assignment_batch_size = 5
-            
-            for start_id in range(1, num_clients + 1, assignment_batch_size):
-                end_id = min(start_id + assignment_batch_size, num_clients + 1)
-                client_ids = list(range(start_id, end_id))
-                
-                assignments = generator.generate_assignments_batch(client_ids, certificate_pool)
-                if assignments:
-                    db.insert_assignments_batch(assignments)
-                    total_assignments += len(assignments)
+            # Все клиенты одним батчем и одной транзакцией записи
+            client_ids = list(range(1, num_clients + 1))
+            assignments = generator.generate_assignments_batch(client_ids, certificate_pool)
+            db.insert_assignments_direct(assignments)
+            total_assignments = len(assignments)
             
             # 7. Финальный сброс буферов
             db.flush_all()
@@ -104,25 +97,24 @@ class TestFullWorkflow:
             assert assignment_count == total_assignments
             assert assignment_count >= 0  # Может быть 0 если никому не назначили сертификаты
             
-            # 9. Тестирование потоковой выгрузки активных сертификатов
-            active_count = 0
-            for chunk_df in db.get_active_certificates_streaming():
-                active_count += len(chunk_df)
-                
-                # Проверяем структуру данных
-                if len(chunk_df) > 0:
-                    assert 'client_id' in chunk_df.columns
-                    assert 'certificate_id' in chunk_df.columns
-                    assert 'expiry_date' in chunk_df.columns
-                    assert 'days_until_expiry' in chunk_df.columns
-            
-            # 10. Создание CSV отчета
+            # 9-10. Потоковая выгрузка активных сертификатов в CSV отчет:
+            # один проход - проверка структуры, подсчет и запись
             csv_path = os.path.join(temp_output_dir, "test_active_certificates.csv")
-            
+            active_count = 0
+
             with open(csv_path, "w", encoding="utf-8") as f:
                 f.write("client_id,certificate_id,expiry_date,days_until_expiry\n")
-                
+
                 for chunk_df in db.get_active_certificates_streaming():
+                    active_count += len(chunk_df)
+
+                    # Проверяем структуру данных
+                    if len(chunk_df) > 0:
+                        assert 'client_id' in chunk_df.columns
+                        assert 'certificate_id' in chunk_df.columns
+                        assert 'expiry_date' in chunk_df.columns
+                        assert 'days_until_expiry' in chunk_df.columns
+
                     chunk_df.to_csv(f, header=False, index=False)
             
             # Проверяем что файл создан и не пустой
@@ -130,10 +122,14 @@ class TestFullWorkflow:
             assert os.path.getsize(csv_path) > 0
             
             # 11. Проверяем содержимое CSV файла
+            # Читается только заголовок: файл не загружается в память целиком
             with open(csv_path, "r", encoding="utf-8") as f:
-                lines = f.readlines()
-                assert len(lines) >= 1  # Минимум заголовок
-                assert "client_id,certificate_id,expiry_date,days_until_expiry" in lines[0]
+                header = f.readline()
+                assert header.rstrip("\n") == (
+                    "client_id,certificate_id,expiry_date,days_until_expiry"
+                )
+                # Строки данных, если есть, идут после заголовка
+                assert os.fstat(f.fileno()).st_size >= len(header.encode("utf-8"))
             
             db.close()
             
@@ -173,23 +169,21 @@ class TestFullWorkflow:
             db.create_tables()
             
             # Генерация данных
-            for batch in generator.generate_clients_parallel():
-                db.insert_clients_batch(batch)
-            
-            for batch in generator.generate_certificates_parallel():
-                db.insert_certificates_batch(batch)
+            db.insert_clients_bulk(
+                chain.from_iterable(generator.generate_clients_parallel())
+            )
+            db.insert_certificates_bulk(
+                chain.from_iterable(generator.generate_certificates_parallel())
+            )
             
             db.flush_all()
             
             # Генерация назначений
             certificate_pool = generator.get_certificate_pool(connection=db.connection)
             
-            for start_id in range(1, num_clients + 1, 20):
-                end_id = min(start_id + 20, num_clients + 1)
-                client_ids = list(range(start_id, end_id))
-                assignments = generator.generate_assignments_batch(client_ids, certificate_pool)
-                if assignments:
-                    db.insert_assignments_batch(assignments)
+            client_ids = list(range(1, num_clients + 1))
+            assignments = generator.generate_assignments_batch(client_ids, certificate_pool)
+            db.insert_assignments_direct(assignments)
             
             db.flush_all()
             
@@ -276,8 +270,8 @@ class TestFullWorkflow:
             db.create_tables()
             
             # Добавляем тестовые данные
-            clients = [{"client_id": i} for i in range(1, 51)]
-            certificates = [{"certificate_id": f"cert-{i}"} for i in range(1, 101)]
+            clients = [(i,) for i in range(1, 51)]
+            certificates = [(f"cert-{i}",) for i in range(1, 101)]
             
             db.insert_clients_batch(clients)
             db.insert_certificates_batch(certificates)
@@ -287,16 +281,15 @@ class TestFullWorkflow:
             from datetime import date, timedelta
             today = date.today()
             
-            assignments = []
-            for client_id in range(1, 51):
-                for i in range(2):  # По 2 сертификата на клиента
-                    cert_id = f"cert-{client_id * 2 + i}"
-                    if cert_id in [f"cert-{j}" for j in range(1, 101)]:
-                        assignments.append({
-                            "client_id": client_id,
-                            "certificate_id": cert_id,
-                            "expiry_date": today + timedelta(days=30 + i * 30)
-                        })
+            # Множество id и даты строятся один раз, а не на каждой итерации
+            cert_ids = {cert_id for (cert_id,) in certificates}
+            expiry_dates = [today + timedelta(days=30 + i * 30) for i in range(2)]
+            assignments = [
+                (client_id, cert_id, expiry_dates[i])
+                for client_id in range(1, 51)
+                for i in range(2)  # По 2 сертификата на клиента
+                if (cert_id := f"cert-{client_id * 2 + i}") in cert_ids
+            ]
             
             db.insert_assignments_batch(assignments)
             db.flush_all()
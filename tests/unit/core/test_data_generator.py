@@ -6,6 +6,7 @@ import pytest
 from datetime import date, timedelta
 from unittest.mock import patch, MagicMock
 import sqlite3
+import uuid
 
 from src.core.data_generator import CertificateGenerator
 
@@ -54,8 +55,8 @@ class TestCertificateGenerator:
         clients = generator.generate_clients_batch(start_id=1, count=5)
         
         assert len(clients) == 5
-        assert clients[0] == {"client_id": 1}
-        assert clients[4] == {"client_id": 5}
+        assert clients[0] == (1,)
+        assert clients[4] == (5,)
 
     def test_generate_certificates_batch(self):
         """Тест генерации батча сертификатов"""
@@ -64,27 +65,36 @@ class TestCertificateGenerator:
         certificates = generator.generate_certificates_batch(start_id=1, count=3)
         
         assert len(certificates) == 3
-        for cert in certificates:
-            assert "certificate_id" in cert
-            assert isinstance(cert["certificate_id"], str)
+        for (cert_id,) in certificates:
+            assert isinstance(cert_id, bytes)
+            assert len(cert_id) == 16
 
     def test_generate_consistent_certificate_id(self):
         """Тест генерации консистентных ID сертификатов"""
         generator = CertificateGenerator(num_clients=10, num_certificates=20)
-        
-        # Один и тот же индекс должен давать один и тот же ID при одинаковом seed
-        with patch('random.seed') as mock_seed, \
-             patch('uuid.uuid4', return_value='test-uuid-1') as mock_uuid:
-            id1 = generator.generate_consistent_certificate_id(5)
-            mock_seed.assert_called_with(42 + 5)
-            assert id1 == 'test-uuid-1'
-        
-        # Разные индексы должны вызывать seed с разными значениями
-        with patch('random.seed') as mock_seed, \
-             patch('uuid.uuid4', return_value='test-uuid-2') as mock_uuid:
-            id2 = generator.generate_consistent_certificate_id(10)
-            mock_seed.assert_called_with(42 + 10)
-            assert id2 == 'test-uuid-2'
+
+        # Один и тот же индекс должен давать один и тот же ID
+        id1 = generator.generate_consistent_certificate_id(5)
+        assert id1 == generator.generate_consistent_certificate_id(5)
+        assert id1 != generator.generate_consistent_certificate_id(10)
+
+        parsed = uuid.UUID(bytes=id1)
+        assert parsed.version == 4
+
+    def test_certificate_ids_independent_of_batching(self):
+        """Тест независимости ID сертификатов от разбиения на батчи"""
+        generator = CertificateGenerator(num_clients=10, num_certificates=20)
+
+        whole = generator.generate_certificates_batch(start_id=1, count=6)
+        parts = generator.generate_certificates_batch(
+            start_id=1, count=2
+        ) + generator.generate_certificates_batch(start_id=3, count=4)
+
+        assert whole == parts
+        assert len({cert_id for (cert_id,) in whole}) == 6
+        assert whole[5][0] == (
+            generator.generate_consistent_certificate_id(5)
+        )
 
     def test_generate_assignments_batch(self):
         """Тест генерации назначений"""
@@ -98,13 +108,31 @@ class TestCertificateGenerator:
         # Проверяем что назначения созданы
         assert len(assignments) >= 0  # Может быть 0 если клиенту не назначено сертификатов
         
-        for assignment in assignments:
-            assert "client_id" in assignment
-            assert "certificate_id" in assignment
-            assert "expiry_date" in assignment
-            assert assignment["client_id"] in client_ids
-            assert assignment["certificate_id"] in certificate_pool
-            assert isinstance(assignment["expiry_date"], date)
+        for client_id, certificate_id, expiry_date in assignments:
+            assert client_id in client_ids
+            assert certificate_id in certificate_pool
+            # Дата - строка ISO, которую БД пишет без адаптера date
+            assert isinstance(expiry_date, str)
+            assert date.fromisoformat(expiry_date).isoformat() == expiry_date
+
+    def test_generate_assignments_batch_unique_per_client(self):
+        """Тест отсутствия повторов сертификатов у одного клиента"""
+        generator = CertificateGenerator(num_clients=10, num_certificates=20)
+
+        client_ids = list(range(1, 101))
+        certificate_pool = [f"cert-{i}" for i in range(30)]
+
+        assignments = generator.generate_assignments_batch(client_ids, certificate_pool)
+
+        pairs = [(client_id, cert_id) for client_id, cert_id, _ in assignments]
+        assert len(pairs) == len(set(pairs))
+        assert [client_id for client_id, _ in pairs] == sorted(
+            client_id for client_id, _ in pairs
+        )
+        for client_id in client_ids:
+            assert sum(1 for c, _ in pairs if c == client_id) <= 20
+
+        assert generator.generate_assignments_batch(client_ids, []) == []
 
     def test_generate_assignments_batch_expiry_dates(self):
         """Тест что даты истечения генерируются в правильном диапазоне"""
@@ -124,9 +152,8 @@ class TestCertificateGenerator:
             min_date = today - timedelta(days=365)
             max_date = today + timedelta(days=7300)
             
-            for assignment in assignments:
-                expiry_date = assignment["expiry_date"]
-                assert min_date <= expiry_date <= max_date
+            for _, _, expiry_date in assignments:
+                assert min_date <= date.fromisoformat(expiry_date) <= max_date
 
     def test_generate_clients_parallel(self):
         """Тест параллельной генерации клиентов"""
@@ -144,7 +171,7 @@ class TestCertificateGenerator:
         assert len(all_clients) == 10
         
         # Проверяем что все ID уникальны
-        client_ids = [client["client_id"] for client in all_clients]
+        client_ids = [client_id for (client_id,) in all_clients]
         assert len(set(client_ids)) == 10
         assert min(client_ids) == 1
         assert max(client_ids) == 10
@@ -165,9 +192,28 @@ class TestCertificateGenerator:
         assert len(all_certificates) == 15
         
         # Проверяем что все ID уникальны
-        cert_ids = [cert["certificate_id"] for cert in all_certificates]
+        cert_ids = [cert_id for (cert_id,) in all_certificates]
         assert len(set(cert_ids)) == 15
 
+    def test_generate_assignments_parallel(self):
+        """Тест генерации назначений в нескольких потоках"""
+        generator = CertificateGenerator(
+            num_clients=25,
+            num_certificates=20,
+            batch_size=4,
+            num_workers=3
+        )
+        certificate_pool = [f"cert-{i}" for i in range(20)]
+
+        batches = list(generator.generate_assignments_parallel(certificate_pool))
+
+        # Каждый батч клиентов обработан ровно один раз
+        assert len(batches) == 7
+        client_ids = {client_id for batch in batches for client_id, _, _ in batch}
+        assert client_ids <= set(range(1, 26))
+        pairs = [(c, cert) for batch in batches for c, cert, _ in batch]
+        assert len(pairs) == len(set(pairs))
+
     def test_get_certificate_pool(self, temp_db_path):
         """Тест получения пула сертификатов"""
         # Создаем тестовую БД с сертификатами
@@ -176,40 +222,28 @@ class TestCertificateGenerator:
         
         cursor.execute("""
             CREATE TABLE certificates (
-                certificate_id TEXT PRIMARY KEY
+                certificate_id BLOB PRIMARY KEY
             )
         """)
         
-        test_certs = [("cert-1",), ("cert-2",), ("cert-3",)]
+        test_certs = [(uuid.uuid4().bytes,) for _ in range(3)]
         cursor.executemany("INSERT INTO certificates VALUES (?)", test_certs)
         conn.commit()
         
         generator = CertificateGenerator(num_clients=10, num_certificates=20)
         certificate_pool = generator.get_certificate_pool(connection=conn)
         
-        assert len(certificate_pool) == 3
-        assert "cert-1" in certificate_pool
-        assert "cert-2" in certificate_pool
-        assert "cert-3" in certificate_pool
-        
-        conn.close()
+        assert certificate_pool.shape == (3, 16)
+        assert {row.tobytes() for row in certificate_pool} == {
+            cert_id for (cert_id,) in test_certs
+        }
 
-    def test_faker_thread_safety(self):
-        """Тест thread-safety для Faker"""
-        generator = CertificateGenerator(num_clients=10, num_certificates=20)
-        
-        # Получаем Faker из разных "потоков" (симулируем разные thread_id)
-        with patch('threading.get_ident', return_value=1):
-            faker1 = generator._get_faker()
-        
-        with patch('threading.get_ident', return_value=2):
-            faker2 = generator._get_faker()
-        
-        # Должны быть разные экземпляры
-        assert faker1 is not faker2
-        
-        # Повторный вызов с тем же thread_id должен вернуть тот же экземпляр
-        with patch('threading.get_ident', return_value=1):
-            faker1_again = generator._get_faker()
+        # Назначения из массива-пула получают 16-байтные ID из этого пула
+        assignments = generator.generate_assignments_batch(
+            list(range(1, 51)), certificate_pool
+        )
+        assert assignments
+        for _, certificate_id, _ in assignments:
+            assert certificate_id in {cert_id for (cert_id,) in test_certs}
         
-        assert faker1 is faker1_again 
\ No newline at end of file
+        conn.close()
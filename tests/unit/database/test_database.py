@@ -2,12 +2,21 @@
 Тесты для работы с базой данных
 """
 
+import os
 import pytest
 import sqlite3
+import uuid
 from datetime import datetime, date, timedelta
+from itertools import chain
 from unittest.mock import patch, MagicMock
 
-from src.database import StreamingCertificateDatabase
+from src.database import (
+    StreamingCertificateDatabase,
+    export_active_certificates_csv,
+    to_julian_day,
+)
+from src.database.database import _iter_active_rows
+from src.utils import BACKEND_INMEM, BACKEND_STREAMING
 
 
 class TestStreamingCertificateDatabase:
@@ -35,7 +44,7 @@ class TestStreamingCertificateDatabase:
 
     def test_insert_clients_batch(self, test_db):
         """Тест вставки клиентов батчами"""
-        clients = [{"client_id": i} for i in range(1, 6)]
+        clients = [(i,) for i in range(1, 6)]
         test_db.insert_clients_batch(clients)
         test_db.flush_all()
         
@@ -48,7 +57,7 @@ class TestStreamingCertificateDatabase:
 
     def test_insert_certificates_batch(self, test_db):
         """Тест вставки сертификатов батчами"""
-        certificates = [{"certificate_id": f"cert-{i}"} for i in range(1, 4)]
+        certificates = [(f"cert-{i}",) for i in range(1, 4)]
         test_db.insert_certificates_batch(certificates)
         test_db.flush_all()
         
@@ -59,19 +68,22 @@ class TestStreamingCertificateDatabase:
         
         assert count == 3
 
+    def test_insert_multi_row_with_remainder(self, test_db):
+        """Тест вставки пачками по несколько строк в VALUES с остатком"""
+        clients = [(i,) for i in range(1, 2501)]
+        test_db.insert_clients_batch(clients)
+        test_db.flush_all()
+
+        cursor = test_db.connection.cursor()
+        cursor.execute("SELECT COUNT(*), MIN(client_id), MAX(client_id) FROM clients")
+
+        assert tuple(cursor.fetchone()) == (2500, 1, 2500)
+
     def test_insert_assignments_batch(self, test_db_with_data):
         """Тест вставки назначений батчами"""
         assignments = [
-            {
-                "client_id": 1,
-                "certificate_id": "cert-1",
-                "expiry_date": date.today() + timedelta(days=30)
-            },
-            {
-                "client_id": 2,
-                "certificate_id": "cert-2",
-                "expiry_date": date.today() + timedelta(days=60)
-            }
+            (1, "cert-1", date.today() + timedelta(days=30)),
+            (2, "cert-2", date.today() + timedelta(days=60))
         ]
         
         test_db_with_data.insert_assignments_batch(assignments)
@@ -84,26 +96,52 @@ class TestStreamingCertificateDatabase:
         
         assert count == 2
 
+    def test_insert_assignments_direct(self, test_db_with_data):
+        """Тест прямой вставки назначений без буфера"""
+        today = date.today()
+        test_db_with_data.insert_assignments_batch([(1, "cert-1", today)])
+        test_db_with_data.insert_assignments_direct([
+            (2, "cert-2", today + timedelta(days=1)),
+            # Генератор отдает дату строкой ISO
+            (3, "cert-3", (today + timedelta(days=2)).isoformat()),
+        ])
+
+        # Накопленный буфер сброшен раньше батча, сам батч в буфер не попал
+        assert test_db_with_data._assignment_buffer == []
+        cursor = test_db_with_data.connection.cursor()
+        cursor.execute("SELECT client_id, expiry_julian FROM client_certificates ORDER BY id")
+        assert [tuple(row) for row in cursor.fetchall()] == [
+            (1, to_julian_day(today)),
+            (2, to_julian_day(today) + 1),
+            (3, to_julian_day(today) + 2),
+        ]
+
+    def test_expiry_julian_computed_on_insert(self, test_db_with_data):
+        """Тест вычисления целого юлианского дня при вставке назначений"""
+        expiry_date = date.today() + timedelta(days=45)
+        test_db_with_data.insert_assignments_batch([
+            (1, "cert-1", expiry_date)
+        ])
+        test_db_with_data.flush_all()
+
+        cursor = test_db_with_data.connection.cursor()
+        cursor.execute(
+            "SELECT expiry_julian, CAST(julianday(expiry_date) + 0.5 AS INTEGER) "
+            "FROM client_certificates"
+        )
+        expiry_julian, sqlite_julian = cursor.fetchone()
+
+        assert expiry_julian == to_julian_day(expiry_date) == sqlite_julian
+        assert expiry_julian - to_julian_day(date.today()) == 45
+
     def test_get_active_certificates_streaming(self, test_db_with_data):
         """Тест получения активных сертификатов потоково"""
         # Добавляем тестовые назначения с активными и неактивными сертификатами
         today = date.today()
         assignments = [
-            {
-                "client_id": 1,
-                "certificate_id": "cert-1",
-                "expiry_date": today + timedelta(days=30)  # Активный
-            },
-            {
-                "client_id": 2,
-                "certificate_id": "cert-2",
-                "expiry_date": today - timedelta(days=30)  # Неактивный
-            },
-            {
-                "client_id": 3,
-                "certificate_id": "cert-3",
-                "expiry_date": today + timedelta(days=60)  # Активный
-            }
+            (1, "cert-1", today + timedelta(days=30)),  # Активный
+            (2, "cert-2", today - timedelta(days=30)),  # Неактивный
+            (3, "cert-3", today + timedelta(days=60))  # Активный
         ]
         
         test_db_with_data.insert_assignments_batch(assignments)
@@ -122,6 +160,96 @@ class TestStreamingCertificateDatabase:
         # Должно быть 2 активных сертификата
         assert active_count == 2
 
+    def test_get_active_certificates_streaming_keyset(self, test_db_with_data):
+        """Тест keyset-пагинации: чанки без пропусков и повторов"""
+        today = date.today()
+        test_db_with_data.insert_assignments_batch([
+            (1, "cert-2", today + timedelta(days=5)),
+            (1, "cert-1", today + timedelta(days=5)),
+            (1, "cert-1", today + timedelta(days=5)),  # Дубликат ключа
+            (2, "cert-3", today + timedelta(days=1)),
+            (3, "cert-4", today - timedelta(days=1)),  # Неактивный
+        ])
+        test_db_with_data.flush_all()
+
+        chunks = list(test_db_with_data.get_active_certificates_streaming(chunk_size=2))
+        rows = [
+            tuple(row)
+            for chunk_df in chunks
+            for row in chunk_df.itertuples(index=False)
+        ]
+
+        assert [len(chunk_df) for chunk_df in chunks] == [2, 2]
+        assert list(chunks[0].columns) == [
+            "client_id", "certificate_id", "expiry_date", "days_until_expiry"
+        ]
+        assert [(row[0], row[1]) for row in rows] == [
+            (1, "cert-1"), (1, "cert-1"), (1, "cert-2"), (2, "cert-3")
+        ]
+        assert [row[3] for row in rows] == [5, 5, 5, 1]
+        assert chunks[0]["client_id"].dtype == "int32"
+        assert chunks[0]["days_until_expiry"].dtype == "int32"
+
+    def test_iter_active_rows(self, test_db_with_data):
+        """Тест потоковой выборки активных сертификатов кортежами"""
+        today = date.today()
+        test_db_with_data.insert_assignments_batch([
+            (2, "cert-2", today + timedelta(days=10)),
+            (1, "cert-1", today - timedelta(days=1)),
+            (1, "cert-3", today + timedelta(days=20)),
+        ])
+        test_db_with_data.flush_all()
+
+        today_jd = to_julian_day(today)
+        rows = [
+            row
+            for chunk in _iter_active_rows(test_db_with_data.connection, today_jd, 1)
+            for row in chunk
+        ]
+
+        assert rows == [
+            (1, "cert-3", str(today + timedelta(days=20)), 20),
+            (2, "cert-2", str(today + timedelta(days=10)), 10),
+        ]
+
+    def test_blob_certificate_id_formatted_as_uuid(self, test_db_with_data):
+        """Тест выдачи BLOB-идентификатора сертификата строкой UUID"""
+        cert_id = uuid.UUID("12345678-1234-4abc-8def-123456789abc")
+        test_db_with_data.insert_certificates_batch([(cert_id.bytes,)])
+        test_db_with_data.insert_assignments_batch([
+            (1, cert_id.bytes, date.today() + timedelta(days=1)),
+        ])
+        test_db_with_data.flush_all()
+
+        cursor = test_db_with_data.connection.cursor()
+        cursor.execute("SELECT typeof(certificate_id) FROM client_certificates")
+        assert cursor.fetchone()[0] == "blob"
+
+        today_jd = to_julian_day(date.today())
+        rows = [
+            row
+            for chunk in _iter_active_rows(test_db_with_data.connection, today_jd, 100)
+            for row in chunk
+        ]
+        assert rows[0][1] == str(cert_id)
+
+    def test_export_active_certificates_csv(self, test_db_with_data, temp_output_dir):
+        """Тест выгрузки отчета через отдельное соединение"""
+        today = date.today()
+        test_db_with_data.insert_assignments_batch([
+            (1, "cert-1", today + timedelta(days=3)),
+            (2, "cert-2", today - timedelta(days=3)),
+        ])
+        test_db_with_data.flush_all()
+
+        csv_path = os.path.join(temp_output_dir, "active_certificates.csv")
+        total = export_active_certificates_csv(test_db_with_data.db_path, csv_path)
+
+        assert total == 1
+        with open(csv_path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        assert lines[1] == f"1,cert-1,{today + timedelta(days=3)},3"
+
     def test_buffering_mechanism(self, temp_db_path):
         """Тест механизма буферизации"""
         db = StreamingCertificateDatabase(
@@ -132,7 +260,7 @@ class TestStreamingCertificateDatabase:
         db.create_tables()
         
         # Добавляем клиентов, но не флашим
-        clients = [{"client_id": i} for i in range(1, 3)]
+        clients = [(i,) for i in range(1, 3)]
         db.insert_clients_batch(clients)
         
         # Проверяем что в БД еще ничего нет (данные в буфере)
@@ -142,7 +270,7 @@ class TestStreamingCertificateDatabase:
         assert count == 0
         
         # Добавляем еще одного клиента (буфер должен сброситься)
-        db.insert_clients_batch([{"client_id": 3}])
+        db.insert_clients_batch([(3,)])
         
         # Теперь данные должны быть в БД
         cursor.execute("SELECT COUNT(*) FROM clients")
@@ -154,8 +282,8 @@ class TestStreamingCertificateDatabase:
     def test_flush_all(self, test_db):
         """Тест принудительного сброса всех буферов"""
         # Добавляем данные в буферы
-        clients = [{"client_id": 1}]
-        certificates = [{"certificate_id": "cert-1"}]
+        clients = [(1,)]
+        certificates = [("cert-1",)]
         
         test_db.insert_clients_batch(clients)
         test_db.insert_certificates_batch(certificates)
@@ -178,6 +306,186 @@ class TestStreamingCertificateDatabase:
         cursor.execute("SELECT COUNT(*) FROM certificates")
         assert cursor.fetchone()[0] == 1
 
+    def test_flush_all_single_commit(self, test_db):
+        """Тест сброса всех буферов одной транзакцией"""
+        today = date.today()
+        test_db.insert_clients_batch([(1,), (2,)])
+        test_db.insert_certificates_batch([("cert-1",)])
+        test_db.insert_assignments_batch([(1, "cert-1", today)])
+
+        statements = []
+        test_db.connection.set_trace_callback(statements.append)
+        test_db.flush_all()
+        test_db.connection.set_trace_callback(None)
+
+        assert sum(sql == "COMMIT" for sql in statements) == 1
+        assert not test_db.connection.in_transaction
+
+        cursor = test_db.connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM client_certificates")
+        assert cursor.fetchone()[0] == 1
+
+    def test_flush_all_keeps_buffers_on_rollback(self, test_db):
+        """Тест сохранения буферов при откате общей транзакции сброса"""
+        test_db.insert_clients_batch([(1,), (2,)])
+        test_db.insert_certificates_batch([("cert-1",)])
+        # NULL в client_id нарушает NOT NULL: откатывается весь сброс
+        test_db.insert_assignments_batch([(None, "cert-1", date.today())])
+
+        with pytest.raises(sqlite3.IntegrityError):
+            test_db.flush_all()
+
+        cursor = test_db.connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM clients")
+        assert cursor.fetchone()[0] == 0
+        assert len(test_db._client_buffer) == 2
+        assert len(test_db._certificate_buffer) == 1
+
+        # Повторный сброс без ошибочной строки записывает сохраненные буферы
+        test_db._assignment_buffer.clear()
+        test_db.flush_all()
+
+        cursor.execute("SELECT COUNT(*) FROM clients")
+        assert cursor.fetchone()[0] == 2
+        assert not test_db._client_buffer
+
+    def test_bulk_load_single_transaction(self, test_db):
+        """Тест массовой загрузки в одной транзакции"""
+        test_db.begin_bulk_load()
+
+        cursor = test_db.connection.cursor()
+        cursor.execute("PRAGMA synchronous")
+        assert cursor.fetchone()[0] == 0  # OFF
+        cursor.execute("PRAGMA wal_autocheckpoint")
+        assert cursor.fetchone()[0] == 0
+
+        test_db.insert_clients_batch([(i,) for i in range(1, 201)])
+        test_db._flush_clients()
+
+        # Буфер сброшен, но транзакция еще не зафиксирована
+        assert test_db.connection.in_transaction
+
+        test_db.end_bulk_load()
+
+        assert not test_db.connection.in_transaction
+        cursor.execute("SELECT COUNT(*) FROM clients")
+        assert cursor.fetchone()[0] == 200
+
+        cursor.execute("PRAGMA synchronous")
+        assert cursor.fetchone()[0] == 1  # NORMAL
+        cursor.execute("PRAGMA wal_autocheckpoint")
+        assert cursor.fetchone()[0] == 1000
+
+        # Финальный checkpoint перенес WAL в БД и обрезал его
+        assert os.path.getsize(test_db.db_path + "-wal") == 0
+
+    def test_bulk_load_commits_by_backend(self, test_db):
+        """Тест промежуточных фиксаций: только в потоковом режиме"""
+        clients = [(i,) for i in range(1, 201)]
+
+        def committed_clients() -> int:
+            with sqlite3.connect(test_db.db_path) as reader:
+                return reader.execute("SELECT COUNT(*) FROM clients").fetchone()[0]
+
+        # Буфер задан явно - режим по умолчанию потоковый
+        assert test_db.backend == BACKEND_STREAMING
+
+        with patch('src.database.database.BULK_COMMIT_ROWS', 100):
+            test_db.begin_bulk_load()
+
+            # Потоковый режим: после BULK_COMMIT_ROWS строк - COMMIT
+            test_db.insert_clients_batch(clients[:100])
+            test_db._flush_clients()
+            assert committed_clients() == 100
+
+            # Режим в памяти: фиксация только в конце загрузки
+            test_db.backend = BACKEND_INMEM
+            test_db.insert_clients_batch(clients[100:])
+            test_db._flush_clients()
+            assert committed_clients() == 100
+
+            test_db.end_bulk_load()
+
+        assert committed_clients() == 200
+
+    def test_insert_bulk_from_iterator(self, test_db):
+        """Тест вставки из итератора батчей одной транзакцией"""
+        batches = ([(i,) for i in range(start, start + 150)] for start in (1, 151))
+        certificates = ((f"cert-{i}",) for i in range(1, 251))
+
+        assert test_db.insert_clients_bulk(chain.from_iterable(batches)) == 300
+        assert test_db.insert_certificates_bulk(certificates) == 250
+        assert not test_db.connection.in_transaction
+
+        cursor = test_db.connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM clients")
+        assert cursor.fetchone()[0] == 300
+        cursor.execute("SELECT COUNT(*) FROM certificates")
+        assert cursor.fetchone()[0] == 250
+
+    def test_migrate_text_certificate_ids(self, temp_db_path):
+        """Тест перевода текстовых certificate_id старой БД в BLOB"""
+        cert_id = uuid.uuid4()
+        connection = sqlite3.connect(temp_db_path)
+        connection.executescript(
+            f"""
+            CREATE TABLE certificates (
+                certificate_id TEXT PRIMARY KEY
+            ) WITHOUT ROWID;
+            CREATE TABLE client_certificates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_id INTEGER NOT NULL,
+                certificate_id TEXT NOT NULL,
+                expiry_date DATE NOT NULL
+            );
+            INSERT INTO certificates VALUES ('{cert_id}');
+            INSERT INTO client_certificates (client_id, certificate_id, expiry_date)
+            VALUES (1, '{cert_id}', '2030-01-01');
+        """
+        )
+        connection.close()
+
+        db = StreamingCertificateDatabase(db_path=temp_db_path, write_buffer_size=100)
+        db.connect()
+        db.create_tables()
+
+        cursor = db.connection.cursor()
+        assert cursor.execute("SELECT certificate_id FROM certificates").fetchall() == [
+            (cert_id.bytes,)
+        ]
+        assert cursor.execute(
+            "SELECT certificate_id FROM client_certificates"
+        ).fetchall() == [(cert_id.bytes,)]
+
+        # Повторный вызов не мигрирует уже переведенную БД
+        db.create_tables()
+        columns = {
+            row[1]: row[2] for row in cursor.execute("PRAGMA table_info(certificates)")
+        }
+        assert columns["certificate_id"] == "BLOB"
+        db.close()
+
+    def test_store_totals(self, test_db_with_data):
+        """Тест сохранения итогов генерации в таблицу meta"""
+        today = date.today()
+        test_db_with_data.insert_assignments_batch(
+            [
+                (1, "cert-1", today + timedelta(days=5)),
+                (2, "cert-2", today - timedelta(days=5)),
+            ]
+        )
+        test_db_with_data.flush_all()
+
+        totals = test_db_with_data.store_totals(to_julian_day(today))
+
+        assert totals["total_clients"] == 5
+        assert totals["total_assignments"] == 2
+        assert totals["total_active"] == 1
+
+        cursor = test_db_with_data.connection.cursor()
+        cursor.execute("SELECT v FROM meta WHERE k = 'active_as_of_jd'")
+        assert cursor.fetchone()[0] == to_julian_day(today)
+
     def test_database_optimization_pragmas(self, temp_db_path):
         """Тест оптимизационных настроек SQLite"""
         db = StreamingCertificateDatabase(db_path=temp_db_path)
@@ -194,6 +502,12 @@ class TestStreamingCertificateDatabase:
         
         cursor.execute("PRAGMA cache_size")
         assert cursor.fetchone()[0] == -64000  # 64MB кэш
+
+        cursor.execute("PRAGMA mmap_size")
+        assert cursor.fetchone()[0] == 268435456  # 256MB memory-mapped I/O
+
+        cursor.execute("PRAGMA temp_store")
+        assert cursor.fetchone()[0] == 2  # MEMORY
         
         db.close()
 
@@ -205,4 +519,38 @@ class TestStreamingCertificateDatabase:
         
         # Проверяем наличие кастомных индексов
         assert 'idx_client_cert_expiry_composite' in indexes
-        assert 'idx_expiry_date' in indexes 
\ No newline at end of file
+        assert 'idx_expiry_date' not in indexes
+        assert 'idx_cc_expiry_covering' in indexes
+
+    def test_create_indexes_drops_expiry_date_index(self, test_db):
+        """Тест удаления неиспользуемого индекса по expiry_date из старой БД"""
+        test_db.connection.execute(
+            "CREATE INDEX idx_expiry_date ON client_certificates(expiry_date)"
+        )
+
+        test_db.create_indexes()
+
+        query = "SELECT name FROM sqlite_master WHERE name = 'idx_expiry_date'"
+        assert test_db.connection.execute(query).fetchall() == []
+
+    def test_create_indexes_after_load(self, temp_db_path):
+        """Тест отложенного построения индексов после загрузки"""
+        db = StreamingCertificateDatabase(db_path=temp_db_path)
+        db.connect()
+        db.create_tables(with_indexes=False)
+
+        query = "SELECT name FROM sqlite_master WHERE type='index' AND name LIKE 'idx_%'"
+        assert db.connection.execute(query).fetchall() == []
+
+        db.insert_clients_batch([(1,)])
+        db.insert_certificates_batch([("cert-1",)])
+        db.insert_assignments_batch([(1, "cert-1", date.today())])
+        db.flush_all()
+        db.create_indexes()
+
+        indexes = {row[0] for row in db.connection.execute(query)}
+        assert indexes == {
+            "idx_client_cert_expiry_composite",
+            "idx_cc_expiry_covering",
+        }
+        db.connection.close()
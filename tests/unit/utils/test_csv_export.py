@@ -0,0 +1,93 @@
+"""
+Тесты для CSV экспорта
+"""
+
+import gzip
+import pytest
+import os
+
+from src.utils.csv_export import gzip_copy, write_active_certificates_csv
+
+
+class TestWriteActiveCertificatesCsv:
+    """Тесты для write_active_certificates_csv"""
+
+    def test_write_chunks(self, temp_output_dir):
+        """Тест записи чанков кортежей в CSV"""
+        csv_path = os.path.join(temp_output_dir, "active.csv")
+        chunks = [
+            [(1, "cert-1", "2030-01-01", 100), (1, "cert-2", "2030-02-01", 131)],
+            [(2, "cert-3", "2031-01-01", 465)],
+        ]
+
+        total = write_active_certificates_csv(iter(chunks), csv_path)
+
+        assert total == 3
+        with open(csv_path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+
+        assert lines[0] == "client_id,certificate_id,expiry_date,days_until_expiry"
+        assert lines[1] == "1,cert-1,2030-01-01,100"
+        assert lines[3] == "2,cert-3,2031-01-01,465"
+
+    def test_write_empty(self, temp_output_dir):
+        """Тест записи отчета без активных сертификатов"""
+        csv_path = os.path.join(temp_output_dir, "active.csv")
+
+        total = write_active_certificates_csv(iter([]), csv_path)
+
+        assert total == 0
+        with open(csv_path, "r", encoding="utf-8") as f:
+            assert f.read() == "client_id,certificate_id,expiry_date,days_until_expiry\n"
+
+    def test_write_replaces_atomically(self, temp_output_dir):
+        """Тест атомарной замены отчета без временного файла"""
+        csv_path = os.path.join(temp_output_dir, "active.csv")
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write("old report\n")
+
+        def failing_chunks():
+            yield [(1, "cert-1", "2030-01-01", 100)]
+            raise RuntimeError("обрыв чтения")
+
+        with pytest.raises(RuntimeError):
+            write_active_certificates_csv(failing_chunks(), csv_path)
+
+        with open(csv_path, "r", encoding="utf-8") as f:
+            assert f.read() == "old report\n"
+        assert not os.path.exists(csv_path + ".tmp")
+
+        write_active_certificates_csv(iter([]), csv_path)
+
+        assert not os.path.exists(csv_path + ".tmp")
+
+    def test_write_removes_stale_gzip(self, temp_output_dir):
+        """Тест удаления сжатой копии прошлого отчета"""
+        csv_path = os.path.join(temp_output_dir, "active.csv")
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write("old report\n")
+        gzip_copy(csv_path)
+
+        write_active_certificates_csv(iter([]), csv_path)
+
+        assert not os.path.exists(csv_path + ".gz")
+
+
+class TestGzipCopy:
+    """Тесты для gzip_copy"""
+
+    def test_gzip_copy(self, temp_output_dir):
+        """Тест создания сжатой копии отчета"""
+        csv_path = os.path.join(temp_output_dir, "active.csv")
+        write_active_certificates_csv(
+            iter([[(1, "cert-1", "2030-01-01", 100)]]), csv_path
+        )
+
+        gz_path = gzip_copy(csv_path)
+
+        assert gz_path == csv_path + ".gz"
+        assert not os.path.exists(gz_path + ".tmp")
+        with gzip.open(gz_path, "rt", encoding="utf-8") as f, open(
+            csv_path, "r", encoding="utf-8"
+        ) as original:
+            assert f.read() == original.read()
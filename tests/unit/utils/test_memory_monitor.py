@@ -2,15 +2,27 @@
 Тесты для монитора памяти
 """
 
+import os
 import pytest
 from unittest.mock import patch, MagicMock
 
-from src.utils.memory_monitor import MemoryMonitor
+from src.utils.memory_monitor import MemoryMonitor, _read_statm_rss
 
 
 class TestMemoryMonitor:
     """Тесты для MemoryMonitor"""
 
+    @pytest.fixture(autouse=True)
+    def reset_process(self):
+        """
+        Сброс закэшированного объекта процесса и времени последней записи
+        в лог; /proc/self/statm отключен, чтобы действовали моки psutil
+        """
+        with patch('src.utils.memory_monitor._process', None), \
+             patch.object(MemoryMonitor, '_last_log', float("-inf")), \
+             patch('src.utils.memory_monitor._read_statm_rss', return_value=None):
+            yield
+
     @patch('src.utils.memory_monitor.psutil.Process')
     def test_get_memory_usage(self, mock_process):
         """Тест получения использования памяти"""
@@ -38,6 +50,27 @@ class TestMemoryMonitor:
             "Память после тестовая операция: 150.50 MB"
         )
 
+    @patch('src.utils.memory_monitor.logger')
+    @patch('src.utils.memory_monitor.MemoryMonitor.get_memory_usage')
+    def test_log_memory_usage_throttled(self, mock_get_memory, mock_logger):
+        """Тест ограничения частоты записи в лог"""
+        mock_get_memory.return_value = 150.5
+
+        with patch('src.utils.memory_monitor.time.monotonic', return_value=100.0):
+            MemoryMonitor.log_memory_usage("первая")
+            MemoryMonitor.log_memory_usage("вторая")  # Пропускается
+            MemoryMonitor.log_memory_usage("важная", force=True)
+
+        with patch('src.utils.memory_monitor.time.monotonic', return_value=101.5):
+            MemoryMonitor.log_memory_usage("после интервала")
+
+        logged = [call.args[0] for call in mock_logger.info.call_args_list]
+        assert logged == [
+            "Память после первая: 150.50 MB",
+            "Память после важная: 150.50 MB",
+            "Память после после интервала: 150.50 MB",
+        ]
+
     @patch('src.utils.memory_monitor.psutil.Process')
     def test_get_memory_usage_different_values(self, mock_process):
         """Тест с разными значениями памяти"""
@@ -53,4 +86,45 @@ class TestMemoryMonitor:
             mock_process.return_value.memory_info.return_value = mock_memory_info
             
             memory_mb = MemoryMonitor.get_memory_usage()
-            assert memory_mb == expected_mb 
\ No newline at end of file
+            assert memory_mb == expected_mb
+
+    @patch('src.utils.memory_monitor.psutil.Process')
+    def test_process_created_once(self, mock_process):
+        """Тест повторного использования объекта процесса между замерами"""
+        mock_process.return_value.pid = os.getpid()
+        mock_process.return_value.memory_info.return_value.rss = 1024 * 1024
+
+        for _ in range(3):
+            assert MemoryMonitor.get_memory_usage() == 1.0
+
+        mock_process.assert_called_once()
+
+        # После fork pid меняется - объект создается заново
+        mock_process.return_value.pid = os.getpid() + 1
+        MemoryMonitor.get_memory_usage()
+        assert mock_process.call_count == 2 
+
+    def test_get_memory_usage_from_statm(self):
+        """Тест чтения RSS из /proc/self/statm без psutil"""
+        rss = 50 * 1024 * 1024
+        with patch('src.utils.memory_monitor._read_statm_rss', return_value=rss), \
+             patch('src.utils.memory_monitor.psutil.Process') as mock_process:
+            assert MemoryMonitor.get_memory_usage() == 50.0
+            mock_process.assert_not_called()
+
+
+class TestReadStatm:
+    """Тесты для чтения /proc/self/statm"""
+
+    def test_read_statm_rss(self, tmp_path):
+        """Тест разбора резидентных страниц"""
+        statm = tmp_path / "statm"
+        statm.write_text("12345 678 90 1 0 200 0\n")
+
+        with patch('src.utils.memory_monitor.STATM_PATH', str(statm)):
+            assert _read_statm_rss() == 678 * os.sysconf("SC_PAGE_SIZE")
+
+    def test_read_statm_rss_missing(self, tmp_path):
+        """Тест отсутствия /proc/self/statm (не Linux)"""
+        with patch('src.utils.memory_monitor.STATM_PATH', str(tmp_path / "missing")):
+            assert _read_statm_rss() is None
@@ -5,12 +5,41 @@
 import pytest
 from unittest.mock import patch, MagicMock
 
-from src.utils.optimizer import SystemOptimizer
+from src.utils.optimizer import (
+    BACKEND_INMEM,
+    BACKEND_STREAMING,
+    ESTIMATED_RECORD_SIZE_BYTES,
+    SystemOptimizer,
+    _cpu_affinity,
+    _read_meminfo,
+    _static_system_info,
+)
 
 
 class TestSystemOptimizer:
     """Тесты для SystemOptimizer"""
 
+    @pytest.fixture(autouse=True)
+    def clear_static_system_info(self):
+        """
+        Сброс кэша ядер и общей памяти; /proc/meminfo, физические ядра и
+        affinity хоста отключены, чтобы действовали моки cpu_count и psutil;
+        наблюдаемые оценки возвращаются к начальным
+        """
+        _static_system_info.cache_clear()
+        SystemOptimizer._compute_settings.cache_clear()
+        observed = {
+            'record_size_bytes': float(ESTIMATED_RECORD_SIZE_BYTES),
+            'assignments_per_client': None,
+        }
+        with patch.dict('src.utils.optimizer._observed', observed), \
+             patch('src.utils.optimizer._read_meminfo', return_value=None), \
+             patch('src.utils.optimizer.psutil.cpu_count', return_value=None), \
+             patch('src.utils.optimizer._cpu_affinity', side_effect=lambda cores: cores):
+            yield
+        _static_system_info.cache_clear()
+        SystemOptimizer._compute_settings.cache_clear()
+
     def test_get_optimal_settings_small_dataset(self):
         """Тест оптимизации для небольшого датасета"""
         with patch('src.utils.optimizer.cpu_count', return_value=4), \
@@ -62,6 +91,62 @@ class TestSystemOptimizer:
             assert info['memory_gb'] == 16.0
             assert info['available_memory_gb'] == 12.0
 
+    def test_workers_limited_by_physical_cores_and_affinity(self):
+        """Тест ограничения потоков физическими и доступными процессу ядрами"""
+        with patch('src.utils.optimizer.cpu_count', return_value=32), \
+             patch('src.utils.optimizer.psutil.cpu_count', return_value=16), \
+             patch('src.utils.optimizer._cpu_affinity', return_value=6), \
+             patch('src.utils.optimizer.psutil.virtual_memory') as mock_memory:
+
+            mock_memory.return_value.total = 64 * 1024**3
+            mock_memory.return_value.available = 48 * 1024**3
+
+            info = SystemOptimizer._get_system_info()
+            assert info['cpu_cores'] == 32
+            assert info['cpu_cores_physical'] == 16
+            assert info['cpu_affinity'] == 6
+
+            # ~5GB данных: по логическим ядрам было бы 8 потоков
+            settings = SystemOptimizer.get_optimal_settings(100_000_000, 1000)
+            assert settings['num_workers'] == 6
+
+    def test_cpu_affinity_slurm_limit(self):
+        """Тест учета лимита ядер Slurm"""
+        with patch.dict('os.environ', {'SLURM_CPUS_PER_TASK': '2'}):
+            assert _cpu_affinity(8) <= 2
+
+    def test_get_optimal_settings_cached(self):
+        """Тест кэширования настроек по корзине свободной памяти"""
+        with patch('src.utils.optimizer.cpu_count', return_value=8), \
+             patch('src.utils.optimizer.psutil.virtual_memory') as mock_memory:
+
+            mock_memory.return_value.total = 16 * 1024**3
+            mock_memory.return_value.available = 12.1 * 1024**3
+            first = SystemOptimizer.get_optimal_settings(1000, 2000)
+
+            # Та же корзина 12.0-12.5GB: результат берется из кэша
+            mock_memory.return_value.available = 12.3 * 1024**3
+            second = SystemOptimizer.get_optimal_settings(1000, 2000)
+
+            assert first == second
+            assert first is not second
+            assert SystemOptimizer._compute_settings.cache_info().hits == 1
+
+    def test_static_system_info_cached(self):
+        """Тест кэширования ядер и общей памяти между вызовами"""
+        with patch('src.utils.optimizer.cpu_count', return_value=8) as mock_cpu, \
+             patch('src.utils.optimizer.psutil.virtual_memory') as mock_memory:
+
+            mock_memory.return_value.total = 16 * 1024**3
+            mock_memory.return_value.available = 12 * 1024**3
+
+            SystemOptimizer.get_optimal_settings(100, 200)
+            SystemOptimizer.get_optimal_settings(1000, 2000)
+
+            mock_cpu.assert_called_once()
+            # Общий объем памяти - один раз, свободная - по разу на вызов
+            assert mock_memory.call_count == 3
+
     def test_estimate_data_size(self):
         """Тест оценки размера данных"""
         data_estimates = SystemOptimizer._estimate_data_size(1000, 2000)
@@ -109,6 +194,105 @@ class TestSystemOptimizer:
         assert batch_size > 0
         assert isinstance(batch_size, int)
 
+    def test_calculate_optimal_batch_size_memory_envelope(self):
+        """Тест ограничения батча запасом свободной памяти на все потоки"""
+        system_info = {
+            'memory_gb': 64.0,
+            'available_memory_gb': 0.5,
+            'cpu_cores': 16
+        }
+        data_estimates = {'target_memory_per_batch_mb': 250.0}
+
+        single = SystemOptimizer._calculate_optimal_batch_size(
+            system_info, data_estimates, 10_000_000, num_workers=1
+        )
+        many = SystemOptimizer._calculate_optimal_batch_size(
+            system_info, data_estimates, 10_000_000, num_workers=16
+        )
+
+        assert many < single
+        # Батчи 16 потоков с накладными расходами укладываются в 70% свободной памяти
+        assert many * 16 * 200 * 1.3 <= 0.7 * 0.5 * 1024**3
+
+    def test_observe_record_size_ewma(self):
+        """Тест сглаживания наблюдаемого размера записи и его влияния на батч"""
+        system_info = {
+            'memory_gb': 64.0,
+            'available_memory_gb': 0.5,
+            'cpu_cores': 16
+        }
+        data_estimates = {'target_memory_per_batch_mb': 250.0}
+        before = SystemOptimizer._calculate_optimal_batch_size(
+            system_info, data_estimates, 10_000_000, num_workers=16
+        )
+
+        SystemOptimizer.observe_record_size(400)
+
+        assert SystemOptimizer._calculate_optimal_batch_size(
+            system_info, data_estimates, 10_000_000, num_workers=16
+        ) < before
+        # Сглаженная оценка: 0.8 * 200 + 0.2 * 400 = 240
+        assert SystemOptimizer._calculate_optimal_batch_size(
+            system_info, data_estimates, 10_000_000, 16, record_size_bytes=240
+        ) == SystemOptimizer._calculate_optimal_batch_size(
+            system_info, data_estimates, 10_000_000, num_workers=16
+        )
+
+    def test_observe_assignments_per_client(self):
+        """Тест уточнения числа назначений на клиента по прошлым генерациям"""
+        def avg_certs(num_certificates=2000):
+            estimates = SystemOptimizer._estimate_data_size(1000, num_certificates)
+            return estimates['avg_certs_per_client']
+
+        assert avg_certs() == 2
+
+        SystemOptimizer.observe_assignments_per_client(10)
+        assert avg_certs() == 10
+
+        SystemOptimizer.observe_assignments_per_client(5)
+        assert avg_certs() == 9
+
+        # Не больше числа сертификатов
+        assert avg_certs(4) == 4
+
+    def test_get_optimal_settings_tracks_observations(self):
+        """Тест пересчета кэшированных настроек после новых наблюдений"""
+        with patch('src.utils.optimizer.cpu_count', return_value=8), \
+             patch('src.utils.optimizer.psutil.virtual_memory') as mock_memory:
+
+            mock_memory.return_value.total = 16 * 1024**3
+            mock_memory.return_value.available = 0.5 * 1024**3
+            before = SystemOptimizer.get_optimal_settings(10_000_000, 1000)
+
+            SystemOptimizer.observe_record_size(2000)
+            after = SystemOptimizer.get_optimal_settings(10_000_000, 1000)
+
+            assert after['batch_size'] < before['batch_size']
+            assert SystemOptimizer._compute_settings.cache_info().hits == 0
+
+    def test_select_backend(self):
+        """Тест выбора режима загрузки по рабочему набору"""
+        # 1.3 * 3GB <= 0.4 * 10GB
+        assert SystemOptimizer._select_backend(3.0, 10.0) == BACKEND_INMEM
+        assert SystemOptimizer._select_backend(4.0, 10.0) == BACKEND_STREAMING
+
+    def test_get_optimal_settings_backend(self):
+        """Тест режима загрузки и буфера записи в настройках"""
+        with patch('src.utils.optimizer.cpu_count', return_value=8), \
+             patch('src.utils.optimizer.psutil.virtual_memory') as mock_memory:
+
+            mock_memory.return_value.total = 16 * 1024**3
+            mock_memory.return_value.available = 12 * 1024**3
+
+            small = SystemOptimizer.get_optimal_settings(1000, 2000)
+            assert small['backend'] == BACKEND_INMEM
+            # Без промежуточных сбросов: буфер вмещает весь батч
+            assert small['write_buffer_size'] == small['batch_size']
+
+            large = SystemOptimizer.get_optimal_settings(100_000_000, 100_000_000)
+            assert large['backend'] == BACKEND_STREAMING
+            assert large['write_buffer_size'] < large['batch_size']
+
     def test_calculate_write_buffer_size(self):
         """Тест расчета размера буфера записи"""
         buffer_size = SystemOptimizer._calculate_write_buffer_size(10000)
@@ -125,4 +309,48 @@ class TestSystemOptimizer:
         
         # Большой датасет
         chunk_size = SystemOptimizer._calculate_chunk_size(10000000)
-        assert chunk_size >= 50000 
\ No newline at end of file
+        assert chunk_size >= 50000
+
+
+class TestReadMeminfo:
+    """Тесты для чтения /proc/meminfo"""
+
+    def test_read_meminfo(self, tmp_path):
+        """Тест разбора MemTotal и MemAvailable"""
+        meminfo = tmp_path / "meminfo"
+        meminfo.write_text(
+            "MemTotal:       16384000 kB\n"
+            "MemFree:         1024000 kB\n"
+            "MemAvailable:   12288000 kB\n"
+            "Buffers:          204800 kB\n"
+        )
+
+        with patch('src.utils.optimizer.MEMINFO_PATH', str(meminfo)):
+            values = _read_meminfo()
+
+        assert values == {
+            "MemTotal": 16384000 * 1024,
+            "MemAvailable": 12288000 * 1024,
+        }
+
+    def test_read_meminfo_missing(self, tmp_path):
+        """Тест отсутствия /proc/meminfo (не Linux)"""
+        with patch('src.utils.optimizer.MEMINFO_PATH', str(tmp_path / "missing")):
+            assert _read_meminfo() is None
+
+    def test_system_info_from_meminfo(self):
+        """Тест использования /proc/meminfo вместо psutil"""
+        meminfo = {"MemTotal": 16 * 1024**3, "MemAvailable": 12 * 1024**3}
+        _static_system_info.cache_clear()
+        try:
+            with patch('src.utils.optimizer._read_meminfo', return_value=meminfo), \
+                 patch('src.utils.optimizer.cpu_count', return_value=8), \
+                 patch('src.utils.optimizer.psutil.virtual_memory') as mock_memory:
+
+                info = SystemOptimizer._get_system_info()
+
+                mock_memory.assert_not_called()
+                assert info['memory_gb'] == 16.0
+                assert info['available_memory_gb'] == 12.0
+        finally:
+            _static_system_info.cache_clear()
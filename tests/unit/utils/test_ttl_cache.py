@@ -0,0 +1,46 @@
+"""
+Тесты для TTL-кэша
+"""
+
+import pytest
+from unittest.mock import patch, MagicMock
+
+from src.utils.ttl_cache import ttl_cache
+
+
+class TestTtlCache:
+    """Тесты для ttl_cache"""
+
+    @patch('src.utils.ttl_cache.time.monotonic')
+    def test_value_cached_within_ttl(self, mock_monotonic):
+        """Тест повторного использования значения до истечения TTL"""
+        func = MagicMock(side_effect=[1, 2])
+        cached = ttl_cache(0.5)(func)
+
+        mock_monotonic.return_value = 10.0
+        assert cached() == 1
+        mock_monotonic.return_value = 10.4
+        assert cached() == 1
+
+        func.assert_called_once()
+
+    @patch('src.utils.ttl_cache.time.monotonic')
+    def test_value_refreshed_after_ttl(self, mock_monotonic):
+        """Тест пересчета значения после истечения TTL"""
+        func = MagicMock(side_effect=[1, 2])
+        cached = ttl_cache(0.5)(func)
+
+        mock_monotonic.return_value = 10.0
+        assert cached() == 1
+        mock_monotonic.return_value = 10.6
+        assert cached() == 2
+
+    def test_cache_per_arguments(self):
+        """Тест отдельного кэша для разных аргументов"""
+        cached = ttl_cache(60)(lambda x: x * 2)
+
+        assert cached(1) == 2
+        assert cached(2) == 4
+
+        cached.cache_clear()
+        assert cached(1) == 2